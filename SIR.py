@@ -1,8 +1,19 @@
 import numpy as np
 import matplotlib.pyplot as plt
 
-def SIR(N, R_0, infectious, I_0, t, model='SIR', incubation=5.2, alpha = 0.05, death = 6, plot_results=False):
-    """ Implementation of the Mathematical SIR model. Also works for SIER and SIERD. """
+try:
+    from scipy.integrate import solve_ivp
+except ImportError:
+    # The adaptive method falls back to the built-in Dormand-Prince integrator
+    solve_ivp = None
+
+def SIR(N, R_0, infectious, I_0, t, model='SIR', incubation=5.2, alpha = 0.05, death = 6, plot_results=False, method='euler'):
+    """
+    Implementation of the Mathematical SIR model. Also works for SIER and SIERD.
+
+    method selects the integrator, see METHODS. Results are sampled daily
+    whatever the integrator.
+    """
     check1 = False
     check2 = False
 
@@ -23,69 +34,73 @@ def SIR(N, R_0, infectious, I_0, t, model='SIR', incubation=5.2, alpha = 0.05, d
     delta = 1/incubation        # Resubsceptibility rate. People lose resistance after delta days on average. ???
     rho = 1/death               # Mortality rate. Probability a person dies from the disease.
 
-    S = N - I_0
-    E = 0
-    I = I_0
-    R = 0
-    D = 0
+    if method != 'euler':
+        results = SIR_batch(N, R_0, gamma, I_0, t, model, incubation, alpha, death, method=method)
+        S_array, E_array, I_array, R_array, D_array = [results[k][:results['length']].tolist() for k in 'SEIRD']
+    else:
+        S = N - I_0
+        E = 0
+        I = I_0
+        R = 0
+        D = 0
 
-    def deltaS():
-        return -beta * I * S/N
+        def deltaS():
+            return -beta * I * S/N
 
-    def deltaE():
-        return beta * I * S/N - delta * E
+        def deltaE():
+            return beta * I * S/N - delta * E
 
-    def deltaI():
-        if check2:
-            return delta * E - (1 - alpha) * gamma * I - alpha * rho * I
-        elif check1:
-            return delta * E - gamma * I
-        else:
-            return beta * I * S/N - gamma * I
+        def deltaI():
+            if check2:
+                return delta * E - (1 - alpha) * gamma * I - alpha * rho * I
+            elif check1:
+                return delta * E - gamma * I
+            else:
+                return beta * I * S/N - gamma * I
 
-    def deltaR():
-        if check2:
-            return (1 - alpha) * gamma * I
-        else:
-            return gamma * I
+        def deltaR():
+            if check2:
+                return (1 - alpha) * gamma * I
+            else:
+                return gamma * I
 
-    def deltaD():
-        if check2:
-            return alpha * rho * I
-        else:
-            return 0
+        def deltaD():
+            if check2:
+                return alpha * rho * I
+            else:
+                return 0
 
-    S_array = [S]
-    E_array = [E]
-    I_array = [I]
-    R_array = [R]
-    D_array = [D]
+        S_array = [S]
+        E_array = [E]
+        I_array = [I]
+        R_array = [R]
+        D_array = [D]
 
-    done = False
-    j = 0
-    while not done and j < t:
-        s = deltaS()
-        e = deltaE()
-        i = deltaI()
-        r = deltaR()
-        d = deltaD()
-
-        S += s
-        E += e
-        I += i
-        R += r
-        D += d
+        done = False
+        j = 0
+        while not done and j < t:
+            s = deltaS()
+            e = deltaE()
+            i = deltaI()
+            r = deltaR()
+            d = deltaD()
 
-        j += 1
+            S += s
+            E += e
+            I += i
+            R += r
+            D += d
+
+            j += 1
 
-        S_array.append(S)
-        E_array.append(E)
-        I_array.append(I)
-        R_array.append(R)
-        D_array.append(D)
+            S_array.append(S)
+            E_array.append(E)
+            I_array.append(I)
+            R_array.append(R)
+            D_array.append(D)
 
-        if I < 0.5:
-            done = True
+            if I < 0.5:
+                done = True
 
     X = np.arange(len(S_array))
 
@@ -102,5 +117,241 @@ def SIR(N, R_0, infectious, I_0, t, model='SIR', incubation=5.2, alpha = 0.05, d
     
     return {'S': S_array, 'I': I_array, 'E': E_array, 'R': R_array, 'D': D_array}
 
+MODELS = ('SIR', 'SEIR', 'SEIRD')
+
+# Integrators, euler and rk4 take steps of one day, adaptive chooses its own step size
+METHODS = ('euler', 'rk4', 'adaptive')
+
+
+def derivatives(y, beta, gamma, delta, alpha, rho, N, model='SIR'):
+    """ Returns the daily change of the (5, ...) array y of S, E, I, R and D counts. """
+    S, E, I, R, D = y
+    infections = beta * I * S/N
+    dy = np.empty_like(y)
+    dy[0] = -infections
+    dy[1] = infections - delta * E
+    if model == 'SEIRD':
+        dy[2] = delta * E - (1 - alpha) * gamma * I - alpha * rho * I
+        dy[3] = (1 - alpha) * gamma * I
+        dy[4] = alpha * rho * I
+    else:
+        dy[2] = delta * E - gamma * I if model == 'SEIR' else infections - gamma * I
+        dy[3] = gamma * I
+        dy[4] = 0
+    return dy
+
+
+def euler_step(f, y):
+    """ Returns y one day later, using a forward Euler step. """
+    return y + f(y)
+
+
+def rk4_step(f, y):
+    """ Returns y one day later, using a classic Runge-Kutta step. """
+    k1 = f(y)
+    k2 = f(y + k1/2)
+    k3 = f(y + k2/2)
+    k4 = f(y + k3)
+    return y + (k1 + 2*k2 + 2*k3 + k4)/6
+
+
+# Dormand-Prince 5(4) coefficients
+DP_C = np.array([0, 1/5, 3/10, 4/5, 8/9, 1, 1])
+DP_A = [
+    [],
+    [1/5],
+    [3/40, 9/40],
+    [44/45, -56/15, 32/9],
+    [19372/6561, -25360/2187, 64448/6561, -212/729],
+    [9017/3168, -355/33, 46732/5247, 49/176, -5103/18656],
+    [35/384, 0, 500/1113, 125/192, -2187/6784, 11/84],
+]
+# Difference between the fifth and fourth order solutions
+DP_E = np.array([35/384 - 5179/57600, 0, 500/1113 - 7571/16695, 125/192 - 393/640,
+                 -2187/6784 + 92097/339200, 11/84 - 187/2100, -1/40])
+
+
+def dormand_prince(f, y, t, rtol=1e-6, atol=1e-6):
+    """
+    Integrates dy/dt = f(y) from day 0 to day t with adaptive step sizes.
+
+    Returns an (t + 1, *y.shape) array with y on every day, interpolated
+    between the steps with cubic Hermite polynomials.
+    """
+    out = np.empty((t + 1,) + y.shape)
+    out[0] = y
+    day, time, h = 1, 0.0, 1.0
+    k = [f(y)] + [None] * 6
+    while day <= t:
+        h = min(h, t - time)
+        for i in range(1, 7):
+            k[i] = f(y + h * sum(a * k[j] for j, a in enumerate(DP_A[i]) if a))
+        new = y + h * sum(a * k[j] for j, a in enumerate(DP_A[6]) if a)
+        scale = atol + rtol * np.maximum(np.abs(y), np.abs(new))
+        error = np.sqrt(np.mean((h * sum(e * k[j] for j, e in enumerate(DP_E) if e) / scale) ** 2))
+        if error <= 1:
+            # Sample the days covered by this step
+            days = np.arange(day, min(t, int(np.floor(time + h + 1e-9))) + 1)
+            theta = ((days - time) / h).reshape((-1,) + (1,) * y.ndim)
+            out[days] = ((2*theta**3 - 3*theta**2 + 1) * y + (theta**3 - 2*theta**2 + theta) * h * k[0]
+                         + (3*theta**2 - 2*theta**3) * new + (theta**3 - theta**2) * h * k[6])
+            day += len(days)
+            time += h
+            # The last stage is the first stage of the next step
+            y, k[0] = new, k[6]
+        h *= min(5.0, max(0.2, 0.9 * max(error, 1e-10) ** -0.2))
+    return out
+
+
+def SIR_batch(N, R_0, gamma, I_0, t, model='SIR', incubation=5.2, alpha=0.05, death=6, method='euler', rtol=1e-6, atol=1e-6):
+    """
+    Vectorized implementation of the Mathematical SIR model, for many parameter sets at once.
+
+    N, R_0, gamma (the recovery rate), I_0, incubation, alpha and death can
+    be arrays, they are broadcast against each other and every combination
+    is integrated as one trajectory. A trajectory stops on the first day
+    with I < 0.5, or after t days.
+
+    method selects the integrator, see METHODS. The adaptive method uses
+    scipy's LSODA, which also handles stiff settings such as high R_0, or
+    the built-in Dormand-Prince integrator if scipy is not installed. rtol
+    and atol are its tolerances.
+
+    Returns a dict with S, E, I, R and D arrays of shape
+    (*broadcast shape, days). Trajectories that stopped early repeat their
+    final values, 'length' holds the number of recorded days of every
+    trajectory.
+    """
+    if model not in MODELS:
+        raise ValueError(f"Choose a valid model ({', '.join(MODELS)}), not {model}")
+    if method not in METHODS:
+        raise ValueError(f"Choose a valid method ({', '.join(METHODS)}), not {method}")
+    N, R_0, gamma, I_0, incubation, alpha, death = np.broadcast_arrays(
+        *[np.asarray(v, dtype=float) for v in (N, R_0, gamma, I_0, incubation, alpha, death)])
+    shape = N.shape
+    N, R_0, gamma, I_0, incubation, alpha, death = [v.ravel() for v in (N, R_0, gamma, I_0, incubation, alpha, death)]
+    beta = R_0 * gamma
+    delta = 1/incubation
+    rho = 1/death
+
+    y = np.zeros((5, len(N)))
+    y[0] = N - I_0
+    y[2] = I_0
+    if method == 'adaptive':
+        out = _integrate_adaptive(y, t, (beta, gamma, delta, alpha, rho, N), model, rtol, atol)
+        return _results(out, shape)
+    step = euler_step if method == 'euler' else rk4_step
+    # Preallocated output, one column per day
+    out = np.empty((5, len(N), t + 1))
+    out[:, :, 0] = y
+    length = np.ones(len(N), dtype=int)
+    active = np.arange(len(N))
+    j = 0
+    while len(active) and j < t:
+        # Only trajectories that have not stopped are integrated
+        params = [v[active] for v in (beta, gamma, delta, alpha, rho, N)]
+        y[:, active] = step(lambda y: derivatives(y, *params, model), y[:, active])
+        j += 1
+        out[:, :, j] = y
+        length[active] += 1
+        active = active[y[2, active] >= 0.5]
+    out = out[:, :, :j + 1].reshape((5,) + shape + (j + 1,))
+    results = dict(zip('SEIRD', out))
+    results['length'] = length.reshape(shape)
+    return results
+
+
+def _integrate_adaptive(y, t, params, model, rtol, atol):
+    """ Returns the (5, trajectories, t + 1) daily samples of an adaptive integration of all trajectories. """
+    if solve_ivp is None:
+        out = dormand_prince(lambda y: derivatives(y, *params, model), y, t, rtol, atol)
+        return np.moveaxis(out, 0, -1)
+    f = lambda _, y: derivatives(y.reshape(5, -1), *params, model).ravel()
+    solution = solve_ivp(f, (0, t), y.ravel(), method='LSODA', t_eval=np.arange(t + 1), rtol=rtol, atol=atol)
+    if solution.status != 0:
+        raise RuntimeError(f"Adaptive integration stopped at day {solution.t[-1] if len(solution.t) else 0:g} of {t}: {solution.message}")
+    return solution.y.reshape(5, -1, t + 1)
+
+
+def _results(out, shape):
+    """ Stops every trajectory of (5, trajectories, days) samples on its first day with I < 0.5, like SIR_batch. """
+    over = out[2] < 0.5
+    length = np.where(over.any(axis=1), over.argmax(axis=1) + 1, out.shape[2])
+    out = out[:, :, :length.max()]
+    # Stopped trajectories repeat their final values
+    days = np.arange(out.shape[2])
+    out = np.take_along_axis(out, np.minimum(days, length[:, None] - 1)[None], axis=2)
+    results = dict(zip('SEIRD', out.reshape((5,) + shape + (out.shape[2],))))
+    results['length'] = length.reshape(shape)
+    return results
+
+
+# np.trapz was renamed to np.trapezoid in NumPy 2.0
+trapezoid = getattr(np, 'trapezoid', None) or np.trapz
+
+
+def lambert_w(x, iterations=50):
+    """ Returns the principal branch of the Lambert W function for x >= -1/e, using Halley's method. """
+    x = np.maximum(np.asarray(x, dtype=float), -1/np.e)
+    # Series around the branch point, and log1p further away
+    p = np.sqrt(2 * (np.e * x + 1))
+    w = np.where(x < -0.25, -1 + p - p**2/3, np.log1p(np.maximum(x, -0.25)))
+    for _ in range(iterations):
+        ew = np.exp(w)
+        f = w * ew - x
+        # W = -1 at the branch point itself, where the derivative vanishes
+        moving = w + 1 > 1e-12
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = np.where(moving, f / (ew * (w + 1) - (w + 2) * f / (2 * w + 2)), 0)
+        w = w - step
+        if np.all(np.abs(step) <= 1e-14 * (1 + np.abs(w))):
+            break
+    return w
+
+
+def _days(s, N, R_0, gamma, I_0, s0):
+    """ Returns the number of days dt/ds spent per unit of s, along the trajectory through s. """
+    i = I_0/N + s0 - s + np.log(s/s0) / R_0
+    return 1 / (gamma * R_0 * s * i)
+
+
+def summary(N, R_0, gamma, I_0=1, points=512):
+    """
+    Closed-form epidemic metrics of the mean-field SIR model, without integrating it.
+
+    All arguments can be arrays. Returns a dict with the total % of the
+    population infected (final size relation), the maximum % infected at
+    once (reached when S = N/R_0) and the number of days until I < 0.5,
+    like the metrics of a simulated history. The duration is a quadrature
+    over S of the time spent at every S, using points samples.
+    """
+    N, R_0, gamma, I_0 = np.broadcast_arrays(*[np.asarray(v, dtype=float) for v in (N, R_0, gamma, I_0)])
+    s0 = (N - I_0) / N
+    # s_inf = s0 * exp(-R_0 * (1 - s_inf)), solved with the Lambert W function
+    s_inf = -lambert_w(-R_0 * s0 * np.exp(-R_0)) / R_0
+    # S stops decreasing at N/R_0, if it is not below that already
+    s_peak = np.minimum(s0, 1 / R_0)
+    peak = I_0 + N * (s0 - s_peak + np.log(s_peak / s0) / R_0)
+    # The pandemic is over at the S where I drops to 0.5, by the same relation as the final size
+    c = I_0/N + s0 - np.log(s0) / R_0 - 0.5/N
+    s_end = -lambert_w(-R_0 * np.exp(-R_0 * c)) / R_0
+
+    # Sample S geometrically closer to both ends, where most days are spent
+    x = np.linspace(0, 1, points)[:, None]
+    duration = np.zeros(N.size)
+    for start, stop, sign in ((s0, s_peak, -1), (s_end, s_peak, 1)):
+        span = np.abs(stop - start).ravel()
+        offset = np.exp(np.log(1e-12) * (1 - x) + np.log(np.maximum(span, 1e-300)) * x) * (span > 0)
+        s = start.ravel() + sign * offset
+        dt = _days(s, *[v.ravel() for v in (N, R_0, gamma, I_0, s0)])
+        duration += trapezoid(dt, offset, axis=0)
+    duration = np.where(peak >= 0.5, duration.reshape(N.shape), 0)
+    return {
+        'Tot_I': (1 - s_inf) * 100,
+        'Max_I': peak / N * 100,
+        'Duration': duration,
+    }
+
+
 if __name__ == "__main__":
     SIR(51*51, 2.2, 2.9, 1, 150, 'SIR', plot_results=True)
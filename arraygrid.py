@@ -0,0 +1,189 @@
+"""
+Array-backed cellular SIR model.
+
+Stores the whole lattice as one small-integer NumPy array and advances all
+cells of a day with whole-array operations instead of looping over Cells.
+"""
+import numpy as np
+
+import neighbourhood
+from grid import Grid, COMPARTMENTS
+
+# State indicators, the index of every compartment in grid.COMPARTMENTS
+S, I, R, E, D = range(len(COMPARTMENTS))
+
+
+class ArrayGrid(Grid):
+    """
+    array-backed grid object
+
+    Takes the same arguments as Grid, so ArrayGrid.simulate and ArrayGrid.run
+    can be used as a drop-in replacement for the Cell based implementation.
+    """
+
+    def __init__(self, width, height, *args, **kwargs):
+        """ Initializes the grid object, see Grid for the arguments. """
+        super().__init__(width, height, *args, **kwargs)
+        # Preallocated buffer for the daily random draws
+        self._chance = np.empty(width * height)
+
+    def _create_cells(self):
+        """ Skips creating Cells, the state buffers hold the whole lattice. """
+
+    def _coords(self, idx):
+        """ Returns the columns and rows of an array of flat cell indices. """
+        return np.divmod(idx, self.height)
+
+    def _neighbour_indices(self, idx):
+        """ Returns a (len(idx), nr_of_neighbours) array with the flat indices of the neighbours of every cell in idx. """
+        if self.neighbours == 'radius':
+            return self._neighbour_table[idx]
+        return self._sample_neighbours(idx)
+
+    def _count_infected_neighbours(self, idx):
+        """ Returns the number of infected neighbours of every cell in idx. """
+        infected = self.state.ravel() == I
+        return infected[self._neighbour_indices(idx)].sum(axis=1)
+
+    def _draw_targets(self, infect_counts, pool):
+        """ Draws infect_counts distinct targets from pool for every infector at once, duplicates between infectors are kept. """
+        if (infect_counts >= len(pool)).any():
+            # One infector reaches the whole pool
+            return pool
+        _, picks = neighbourhood.sample_distinct(self.rng, infect_counts, np.full(len(infect_counts), len(pool)))
+        return pool[picks]
+
+    def _step_all_s_based(self):
+        """ Mean-field S-based step, every susceptible cell sees the same number of infected cells. """
+        current = self.state.ravel()
+        new = self._next.ravel()
+        new[:] = current
+        susceptible = np.flatnonzero(current == S)
+        infected = np.flatnonzero(current == I)
+        # S -> I (or S -> E), every susceptible cell has the same chance of getting infected
+        p = min(1.0, self.p_infect * len(infected))
+        infections = self.rng.choice(susceptible, self.rng.binomial(len(susceptible), p), replace=False)
+        if len(infections):
+            # Make sure there is at least one infection
+            self.has_infected = True
+        new[infections] = I if self.model == 'SIR' else E
+        self._transition(S, I if self.model == 'SIR' else E, len(infections))
+        # I -> R
+        if self.has_infected:
+            recovered = self.rng.choice(infected, self.rng.binomial(len(infected), min(1.0, self.gamma)), replace=False)
+            new[recovered] = R
+            self._transition(I, R, len(recovered))
+        # E -> I
+        exposed = np.flatnonzero(current == E)
+        if self.exposed_phase_threshold < 1:
+            exposed = self.rng.choice(exposed, self.rng.binomial(len(exposed), self.exposed_phase_threshold), replace=False)
+        new[exposed] = I
+        self._transition(E, I, len(exposed))
+        self.state, self._next = self._next, self.state
+        return not self.counts[I]
+
+    def _step_all_i_based(self):
+        """ Mean-field I-based step, every infected cell draws its targets from all susceptible cells. """
+        current = self.state.ravel()
+        new = self._next.ravel()
+        new[:] = current
+        susceptible = np.flatnonzero(current == S)
+        infected = np.flatnonzero(current == I)
+        exposed = np.flatnonzero(current == E)
+        # E -> I
+        exposed = exposed[self.rng.random(len(exposed)) < self.delta]
+        new[exposed] = I
+        self._transition(E, I, len(exposed))
+        # I -> R
+        recovered = self.rng.random(len(infected)) < self.gamma
+        new[infected[recovered]] = R
+        self._transition(I, R, np.count_nonzero(recovered))
+        # Targets must be susceptible at the start of the day
+        infect_counts = int(self.beta) + (self.rng.random(len(infected)) < self.beta % 1)
+        targets = np.unique(self._draw_targets(infect_counts, susceptible))
+        new[targets] = I if self.model == 'SIR' else E
+        self._transition(S, I if self.model == 'SIR' else E, len(targets))
+        self.state, self._next = self._next, self.state
+        # Done when no cell stays infected, no exposed cell turns infected and nobody can be infected
+        return recovered.all() and not len(exposed) and not (len(infected) and len(susceptible))
+
+    def _step_s_based(self):
+        """ Evaluates the state of all cells based on their neighbours. """
+        current = self.state.ravel()
+        new = self._next.ravel()
+        new[:] = current
+        chance = self.rng.random(out=self._chance)
+        # S -> I (or S -> E)
+        susceptible = np.flatnonzero(current == S)
+        infections = susceptible[chance[susceptible] < self.p_infect * self._count_infected_neighbours(susceptible)]
+        if len(infections):
+            # Make sure there is at least one infection
+            self.has_infected = True
+        new[infections] = I if self.model == 'SIR' else E
+        self._transition(S, I if self.model == 'SIR' else E, len(infections))
+        # I -> R
+        if self.has_infected:
+            recovered = (current == I) & (chance < self.gamma)
+            new[recovered] = R
+            self._transition(I, R, np.count_nonzero(recovered))
+        # E -> I
+        activated = (current == E) & (chance < self.exposed_phase_threshold)
+        new[activated] = I
+        self._transition(E, I, np.count_nonzero(activated))
+        self.state, self._next = self._next, self.state
+        return not self.counts[I]
+
+    def _step_i_based(self):
+        """ Lets every infected cell infect its susceptible neighbours, for all infected cells at once. """
+        current = self.state.ravel()
+        new = self._next.ravel()
+        new[:] = current
+        infected = np.flatnonzero(current == I)
+        exposed = np.flatnonzero(current == E)
+        # E -> I
+        activated = exposed[self.rng.random(len(exposed)) < self.delta]
+        new[activated] = I
+        self._transition(E, I, len(activated))
+        # I -> R
+        recovered = self.rng.random(len(infected)) < self.gamma
+        new[infected[recovered]] = R
+        self._transition(I, R, np.count_nonzero(recovered))
+        # Every infected cell chooses its targets among the neighbours that are susceptible at the start of the day
+        infect_counts = int(self.beta) + (self.rng.random(len(infected)) < self.beta % 1)
+        neighbours = self._neighbour_indices(infected)
+        available = (current == S)[neighbours]
+        chosen = neighbourhood.choose_targets(self.rng, neighbours, available, infect_counts)
+        # Cells chosen by several infected cells are infected once
+        targets = np.unique(neighbours[chosen])
+        new[targets] = I if self.model == 'SIR' else E
+        self._transition(S, I if self.model == 'SIR' else E, len(targets))
+        self.state, self._next = self._next, self.state
+        # Done when no cell stays infected, no exposed cell turns infected and no infected cell has susceptible neighbours
+        return recovered.all() and not len(activated) and not available.any()
+
+    def step(self):
+        """ Steps one day ahead. Evaluates the state of all cells in the grid at once. """
+        if self.neighbours == 'all':
+            # O(N) mean-field engine
+            if self.modeltype == "S-based":
+                return self._step_all_s_based()
+            return self._step_all_i_based()
+        if self.modeltype == "S-based":
+            return self._step_s_based()
+        return self._step_i_based()
+
+    def infect(self, x, y):
+        """ Sets state of cell at x, y to I=infected. """
+        self._set_state(x, y, I)
+
+    def kill(self, x, y):
+        """ Sets state of cell at x, y to D=dead. """
+        self._set_state(x, y, D)
+
+    def get_states(self):
+        """ Returns a grid of state indicators. """
+        return self.state.copy()
+
+
+if __name__ == "__main__":
+    print(ArrayGrid.simulate(51, 51, 2.2))
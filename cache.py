@@ -0,0 +1,179 @@
+"""
+Content-addressed result cache for the cellular and mathematical SIR models.
+
+Results are stored under a hash of the full parameter set, the seed and the
+engine version. An in-memory LRU sits in front of an on-disk store that
+evicts its least recently used files once it grows beyond a size limit.
+"""
+import copy
+import hashlib
+import os
+import pickle
+import tempfile
+
+from collections import OrderedDict
+
+import numpy as np
+
+from SIR import SIR as Mat_SIR
+
+# Bump when a change to the engines alters their results, this invalidates every cached result
+ENGINE_VERSION = 3
+
+# Default location of the on-disk store
+CACHE_DIR = './simulations/cache'
+
+
+def _normalize(value):
+    """ Returns a reproducible representation of a parameter value. """
+    if isinstance(value, np.random.SeedSequence):
+        return ('SeedSequence', value.entropy, value.spawn_key)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _normalize(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_normalize(v) for v in value)
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def make_key(name, *args, **kwargs):
+    """ Returns the hash of a function name, its arguments and the engine version. """
+    content = repr((ENGINE_VERSION, name, _normalize(args), _normalize(kwargs)))
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class Cache:
+    """
+    Two level result cache
+
+    Attributes:
+        root (str):         directory of the on-disk store
+        max_bytes (int):    size of the on-disk store at which old results are evicted
+        max_items (int):    number of results kept in memory
+    """
+
+    def __init__(self, root=CACHE_DIR, max_bytes=2**30, max_items=256):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self.memory = OrderedDict()
+        # Estimate of the store size, None until the store has been scanned
+        self._disk_bytes = None
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        """ Returns the path of the file storing a key. """
+        return os.path.join(self.root, f'{key}.pkl')
+
+    def _remember(self, key, value):
+        """ Puts a copy of a value in the memory LRU, so callers can't change the cached value. """
+        self.memory[key] = copy.deepcopy(value)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_items:
+            self.memory.popitem(last=False)
+
+    def get(self, key, default=None):
+        """ Returns the value stored under key, or default if it is not cached. """
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return copy.deepcopy(self.memory[key])
+        try:
+            with open(self._path(key), 'rb') as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return default
+        # Mark the file as recently used
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            # Evicted by another process since it was read
+            pass
+        self._remember(key, value)
+        return value
+
+    def put(self, key, value):
+        """ Stores value under key, in memory and on disk. """
+        self._remember(key, value)
+        # Write to a temporary file first, so other processes never read half a result
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            # The size is taken before the file is visible to the evictions of other processes
+            size = f.tell()
+        os.replace(tmp, self._path(key))
+        if self._disk_bytes is None:
+            self._disk_bytes = self._scan()[1]
+        else:
+            self._disk_bytes += size
+        if self._disk_bytes > self.max_bytes:
+            self.evict()
+
+    def _scan(self):
+        """ Returns the cached files, least recently used first, and their total size. """
+        files = []
+        for entry in os.scandir(self.root):
+            if entry.name.endswith('.pkl'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    # Removed by another process
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()
+        return files, sum(size for _, size, _ in files)
+
+    def evict(self):
+        """ Removes the least recently used files until the store fits in max_bytes. """
+        files, total = self._scan()
+        for _, size, path in files:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # Already removed by another process
+                pass
+            total -= size
+        self._disk_bytes = total
+
+    def __call__(self, name, fn, *args, **kwargs):
+        """ Returns fn(*args, **kwargs), computing it only if it is not cached under name yet. """
+        key = make_key(name, *args, **kwargs)
+        value = self.get(key)
+        if value is None:
+            value = fn(*args, **kwargs)
+            self.put(key, value)
+        return value
+
+
+_caches = {}
+
+
+def get_cache(root=CACHE_DIR):
+    """ Returns the cache of a directory, shared within this process. """
+    if root not in _caches:
+        _caches[root] = Cache(root)
+    return _caches[root]
+
+
+def simulate(cls, *args, seed=None, cache=None, **kwargs):
+    """
+    Cached version of cls.simulate.
+
+    Runs without a seed, or seeded with a Generator, are not reproducible
+    and are never cached. Neither are runs that save an event log, as a
+    cached result would not write the log.
+    """
+    kwargs.pop('verbose', None)
+    if seed is None or isinstance(seed, np.random.Generator) or isinstance(kwargs.get('event_log'), str):
+        return cls.simulate(*args, seed=seed, **kwargs)
+    cache = cache or get_cache()
+    return cache(f'{cls.__module__}.{cls.__qualname__}.simulate', cls.simulate, *args, seed=seed, **kwargs)
+
+
+def SIR(*args, cache=None, **kwargs):
+    """ Cached version of SIR.SIR. """
+    kwargs.pop('plot_results', None)
+    cache = cache or get_cache()
+    return cache('SIR.SIR', Mat_SIR, *args, **kwargs)
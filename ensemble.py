@@ -0,0 +1,166 @@
+"""
+Batched ensemble of the cellular SIR model.
+
+Advances many independent replicates of the same grid together as one
+(replicates, width, height) state tensor, sharing neighbour tables and
+random draws between them.
+"""
+import numpy as np
+
+import neighbourhood
+from arraygrid import ArrayGrid, S, I, R, E, D
+from grid import COMPARTMENTS
+
+
+class Ensemble:
+    """
+    ensemble object
+
+    Attributes:
+        replicates (int):   number of independent replicates
+        width (int):        number of cells the grid measures as width
+        height (int):       number of cells the grid measures as height
+
+    Keyword arguments are the same as for Grid.
+    """
+
+    def __init__(self, replicates, width, height, **kwargs):
+        """ Initializes all replicates with susceptible cells only. """
+        self.replicates = replicates
+        self.width = width
+        self.height = height
+        # Grid holding the parameters, neighbour table and random generator shared by all replicates
+        self.grid = ArrayGrid(width, height, **kwargs)
+        self.rng = self.grid.rng
+        self.state = np.zeros((replicates, width, height), dtype=np.uint8)
+        # Flat view with one row of cells per replicate
+        self._cells = self.state.reshape(replicates, width * height)
+        self.has_infected = np.zeros(replicates, dtype=bool)
+        # Replicates that have not finished yet
+        self.active = np.arange(replicates)
+
+    def seed(self, infected=None, dead=None):
+        """ Randomly infects and kills distinct cells in every replicate. """
+        infected = self.grid.infected if infected is None else infected
+        dead = self.grid.dead if dead is None else dead
+        counts = np.full(self.replicates, infected + dead)
+        owner, cells = neighbourhood.sample_distinct(self.rng, counts, np.full(self.replicates, self._cells.shape[1]))
+        # The first draws of every replicate are infected, the others dead
+        first = np.arange(len(owner)) - (np.cumsum(counts) - counts)[owner] < infected
+        self._cells[owner[first], cells[first]] = I
+        self._cells[owner[~first], cells[~first]] = D
+
+    def _neighbour_indices(self, cells):
+        """ Returns the neighbours of every cell in cells, sampled per cell in random and gauss mode. """
+        if self.grid.neighbours == 'radius':
+            return self.grid._neighbour_table[cells]
+        return self.grid._sample_neighbours(cells)
+
+    def _step_s_based(self, current):
+        """ Evaluates the state of all cells of the active replicates based on their neighbours. """
+        new = current.copy()
+        chance = self.rng.random(current.shape)
+        # S -> I (or S -> E)
+        rep, cell = np.nonzero(current == S)
+        if self.grid.neighbours == 'all':
+            counts = (current == I).sum(axis=1)[rep]
+        else:
+            counts = (current[rep[:, None], self._neighbour_indices(cell)] == I).sum(axis=1)
+        infections = chance[rep, cell] < self.grid.p_infect * counts
+        new[rep[infections], cell[infections]] = I if self.grid.model == 'SIR' else E
+        # Make sure there is at least one infection
+        has_infected = self.has_infected[self.active] | (np.bincount(rep[infections], minlength=len(current)) > 0)
+        self.has_infected[self.active] = has_infected
+        # I -> R
+        new[(current == I) & (chance < self.grid.gamma) & has_infected[:, None]] = R
+        # E -> I
+        new[(current == E) & (chance < self.grid.exposed_phase_threshold)] = I
+        return new, ~(new == I).any(axis=1)
+
+    def _step_i_based(self, current):
+        """ Lets every infected cell of the active replicates infect its susceptible neighbours. """
+        new = current.copy()
+        busy = np.zeros(len(current), dtype=bool)
+        # E -> I
+        rep, cell = np.nonzero(current == E)
+        activated = self.rng.random(len(rep)) < self.grid.delta
+        new[rep[activated], cell[activated]] = I
+        busy[rep[activated]] = True
+        # I -> R
+        rep, cell = np.nonzero(current == I)
+        recovered = self.rng.random(len(rep)) < self.grid.gamma
+        new[rep[recovered], cell[recovered]] = R
+        busy[rep[~recovered]] = True
+        # Targets must be susceptible at the start of the day
+        infect_counts = int(self.grid.beta) + (self.rng.random(len(rep)) < self.grid.beta % 1)
+        susceptible = current == S
+        if self.grid.neighbours == 'all':
+            rep_s, cell_s = np.nonzero(susceptible)
+            pool_sizes = np.bincount(rep_s, minlength=len(current))
+            owner, picks = neighbourhood.sample_distinct(self.rng, infect_counts, pool_sizes[rep])
+            targets = (np.cumsum(pool_sizes) - pool_sizes)[rep[owner]] + picks
+            target_rep, target_cell = rep_s[targets], cell_s[targets]
+            busy[rep[pool_sizes[rep] > 0]] = True
+        else:
+            neigh = self._neighbour_indices(cell)
+            available = susceptible[rep[:, None], neigh]
+            chosen = neighbourhood.choose_targets(self.rng, neigh, available, infect_counts)
+            target_rep, target_cell = np.broadcast_to(rep[:, None], neigh.shape)[chosen], neigh[chosen]
+            busy[rep[available.any(axis=1)]] = True
+        new[target_rep, target_cell] = I if self.grid.model == 'SIR' else E
+        return new, ~busy
+
+    def step(self):
+        """ Steps all active replicates one day ahead and retires the finished ones. """
+        current = self._cells[self.active]
+        if self.grid.modeltype == "S-based":
+            new, done = self._step_s_based(current)
+        else:
+            new, done = self._step_i_based(current)
+        self._cells[self.active] = new
+        self.active = self.active[~done]
+        return not len(self.active)
+
+    def count_states(self, model="SIR", replicates=None):
+        """ Returns a (len(replicates), len(model)) array with a count of each state, for all replicates by default. """
+        replicates = np.arange(self.replicates) if replicates is None else replicates
+        offset = np.arange(len(replicates))[:, None] * len(COMPARTMENTS)
+        counts = np.bincount((self._cells[replicates] + offset).ravel(), minlength=len(replicates) * len(COMPARTMENTS))
+        counts = counts.reshape(len(replicates), len(COMPARTMENTS))
+        return counts[:, [COMPARTMENTS.index(k) for k in model]]
+
+    def run(self, model="SIR"):
+        """
+        Runs all replicates until no more cells are infected.
+
+        Returns a (replicates, timesteps, len(model)) array of counts.
+        Finished replicates repeat their final counts, self.lengths holds
+        the number of recorded timesteps of every replicate.
+        """
+        self.lengths = np.ones(self.replicates, dtype=int)
+        history = [self.count_states(model)]
+        done = not len(self.active)
+        while not done:
+            stepped = self.active
+            self.lengths[stepped] += 1
+            done = self.step()
+            # Only the replicates that stepped need to be recounted
+            counts = history[-1].copy()
+            counts[stepped] = self.count_states(model, stepped)
+            history.append(counts)
+        return np.stack(history, axis=1)
+
+    def histories(self, counts, model="SIR"):
+        """ Splits a count array from run into one history dict per replicate, as returned by Grid.run. """
+        return [{k: counts[r, :self.lengths[r], i] for i, k in enumerate(model)} for r in range(self.replicates)]
+
+    @classmethod
+    def simulate(cls, replicates, *args, model='SIR', **kwargs):
+        """ Runs a full simulation of all replicates, returns the count array of run. """
+        ensemble = cls(replicates, *args, **kwargs)
+        ensemble.seed()
+        return ensemble.run(model)
+
+
+if __name__ == "__main__":
+    print(Ensemble.simulate(25, 22, 22, beta=0.5, gamma=0.1).shape)
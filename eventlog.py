@@ -0,0 +1,136 @@
+"""
+Compact event log of the state changes of a cellular SIR run.
+
+A run is stored as the flat index and new state indicator of every cell
+that changed, grouped per day. Within a day the sorted indices are delta
+encoded. Keyframes of the full grid every few days let a replay jump to
+any day without applying all events since the start.
+"""
+import numpy as np
+
+from cell import COMPARTMENTS
+
+# Number of days between two keyframes
+KEYFRAME_INTERVAL = 50
+
+
+class EventLog:
+    """
+    event log object
+
+    Attributes:
+        shape (tuple):      width and height of the grid
+        keyframe_interval (int): number of days between two stored full grids
+    """
+
+    def __init__(self, shape, keyframe_interval=KEYFRAME_INTERVAL):
+        self.shape = tuple(shape)
+        self.keyframe_interval = keyframe_interval
+        self.days = 0
+        # Events of every day, as separate arrays until saved
+        self._deltas = []
+        self._states = []
+        self._keyframes = []
+        self._previous = None
+
+    def __len__(self):
+        return self.days
+
+    def append(self, state):
+        """ Records the state indicators of all cells for the next day. """
+        current = state.ravel()
+        if self._previous is None:
+            changed = np.empty(0, dtype=np.int64)
+        else:
+            changed = np.flatnonzero(current != self._previous)
+        # The first index of a day is stored as is, the others as the distance to the previous index
+        self._deltas.append(np.diff(changed, prepend=0).astype(np.uint32))
+        self._states.append(current[changed].astype(np.uint8))
+        if self.days % self.keyframe_interval == 0:
+            self._keyframes.append(state.copy())
+        self._previous = current.copy()
+        self.days += 1
+
+    def save(self, path):
+        """ Writes the log to a compressed .npz file. """
+        np.savez_compressed(
+            path,
+            shape=np.array(self.shape),
+            keyframe_interval=self.keyframe_interval,
+            counts=np.array([len(d) for d in self._deltas], dtype=np.int64),
+            deltas=np.concatenate(self._deltas),
+            states=np.concatenate(self._states),
+            keyframes=np.stack(self._keyframes),
+        )
+
+
+class Replay:
+    """
+    replay of a saved event log
+
+    Can be stepped like a Grid, so the visualisation can play back a run
+    without simulating it again.
+
+    Attributes:
+        path (str):         .npz file written by EventLog.save
+    """
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.width, self.height = data['shape'].tolist()
+            self.keyframe_interval = int(data['keyframe_interval'])
+            counts = data['counts']
+            self.deltas = data['deltas']
+            self.states = data['states']
+            self.keyframes = data['keyframes']
+        # Events of day t are deltas[offsets[t]:offsets[t + 1]]
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+        self.days = len(counts)
+        self.day = 0
+        self.state = self.keyframes[0].copy()
+
+    def __len__(self):
+        return self.days
+
+    def _apply(self, state, day):
+        """ Applies the events of a day to a grid of state indicators. """
+        start, stop = self.offsets[day], self.offsets[day + 1]
+        state.ravel()[np.cumsum(self.deltas[start:stop], dtype=np.int64)] = self.states[start:stop]
+
+    def state_at(self, day):
+        """ Returns the grid of state indicators on a day, rebuilt from the nearest keyframe. """
+        day = range(self.days)[day]
+        keyframe = day // self.keyframe_interval
+        state = self.keyframes[keyframe].copy()
+        for t in range(keyframe * self.keyframe_interval + 1, day + 1):
+            self._apply(state, t)
+        return state
+
+    def seek(self, day):
+        """ Jumps to a day. """
+        self.state = self.state_at(day)
+        self.day = range(self.days)[day]
+
+    def step(self):
+        """ Steps one day ahead. Returns True on the last recorded day. """
+        if self.day + 1 < self.days:
+            self.day += 1
+            self._apply(self.state, self.day)
+        return self.day + 1 == self.days
+
+    def get_states(self):
+        """ Returns a grid of state indicators. """
+        return self.state.copy()
+
+    def count_states(self, model="SIR"):
+        """ Returns a dict with a count of each state. """
+        counts = np.bincount(self.state.ravel(), minlength=len(COMPARTMENTS))
+        return {k: int(counts[COMPARTMENTS.index(k)]) for k in model}
+
+    def __iter__(self):
+        """ Yields the grid of state indicators of every day, from the first day on. """
+        state = self.keyframes[0].copy()
+        yield state.copy()
+        for day in range(1, self.days):
+            self._apply(state, day)
+            yield state.copy()
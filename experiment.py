@@ -5,9 +5,9 @@ import matplotlib.pyplot as plt
 
 from tqdm import tqdm
 
+import cache
 from grid import Grid
 from main import SIRGui
-from SIR import SIR as Mat_SIR
 
 
 
@@ -42,10 +42,11 @@ class Experiment:
         """ Runs the experiment. """
         MA_stats = []
         CA_stats = []
+        # The mathematical model is deterministic, so it only has to run once
+        MA_results = cache.SIR(self.size[0]*self.size[1], self.beta/self.gamma, self.gamma, self.infected, 750, 'SIR')
         for i in tqdm(range(1, self.N+1)):
-            # Run mathematical model and store results
-            results = Mat_SIR(self.size[0]*self.size[1], self.beta/self.gamma, self.gamma, self.infected, 750, 'SIR')
-            results = pd.DataFrame.from_dict(results)
+            # Store results of the mathematical model
+            results = pd.DataFrame.from_dict(MA_results)
             results['Timestep'] = results.index
             results['Sim'] = i
             MA_stats.append(results)
@@ -0,0 +1,123 @@
+"""
+Headless export of the cellular SIR model to images and animations.
+
+Renders the state of a grid straight from its state indicators, one frame
+at a time, so long runs on large grids can be exported without a display
+and without keeping the whole run in memory. PNG frames need nothing but
+NumPy and zlib. GIF animations are written with the GIF encoder of PIL,
+also one frame at a time, MP4 animations need imageio with ffmpeg.
+"""
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from grid import Grid
+from eventlog import Replay
+
+try:
+    import imageio
+except ImportError:
+    imageio = None
+
+try:
+    from PIL import Image, GifImagePlugin
+except ImportError:
+    Image = None
+
+# RGB color of every state indicator, the same colors as the visualisation (S, I, R, E, D)
+COLORS = np.array([[190, 190, 190], [255, 0, 0], [0, 128, 0], [255, 255, 0], [0, 0, 0]], dtype=np.uint8)
+
+
+def snapshots(source, every=1):
+    """
+    Yields the grid of state indicators of every every-th day of a run, one at a time.
+
+    source is a seeded Grid that is run until the pandemic is over, a Replay
+    or the path of a saved event log, or any iterable of state arrays such
+    as a CellHistory.
+    """
+    if isinstance(source, str):
+        source = Replay(source)
+    if isinstance(source, Grid):
+        for _, _, snapshot in source.iter_run(snapshots=every):
+            if snapshot is not None:
+                yield snapshot
+        return
+    for day, state in enumerate(source):
+        if day % every == 0:
+            yield np.asarray(state)
+
+
+def render(state, scale=1, colors=COLORS):
+    """ Returns an RGB image of a grid of state indicators, grid rows are image rows and every cell is scale pixels wide. """
+    image = np.asarray(colors, dtype=np.uint8)[np.asarray(state).T]
+    if scale > 1:
+        image = image.repeat(scale, axis=0).repeat(scale, axis=1)
+    return image
+
+
+def _chunk(tag, data):
+    """ Returns a PNG chunk. """
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+
+def write_png(path, image, level=6):
+    """ Writes an RGB image to a PNG file. """
+    height, width = image.shape[:2]
+    # Every row starts with filter type 0, no filtering
+    raw = np.concatenate((np.zeros((height, 1), dtype=np.uint8), image.reshape(height, width * 3)), axis=1)
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        f.write(_chunk(b'IDAT', zlib.compress(raw.tobytes(), level)))
+        f.write(_chunk(b'IEND', b''))
+
+
+def export_frames(source, directory, every=1, scale=1, colors=COLORS, prefix='frame'):
+    """ Writes every every-th day of a run to a numbered PNG file in directory, returns the number of frames. """
+    os.makedirs(directory, exist_ok=True)
+    frames = 0
+    for state in snapshots(source, every):
+        write_png(os.path.join(directory, f'{prefix}{frames:05d}.png'), render(state, scale, colors))
+        frames += 1
+    return frames
+
+
+def export_animation(source, path, every=1, scale=1, colors=COLORS, fps=10):
+    """ Writes every every-th day of a run to an animated GIF or MP4 file, depending on the extension of path. """
+    images = (render(state, scale, colors) for state in snapshots(source, every))
+    if path.lower().endswith('.gif'):
+        if Image is None:
+            raise ImportError("Exporting a GIF needs PIL, install it with pip install pillow")
+        _write_gif(path, images, colors, fps)
+        return
+    if imageio is None:
+        raise ImportError("Exporting video needs imageio, install it with pip install imageio[ffmpeg]")
+    # Frames are handed to ffmpeg as they are rendered
+    with imageio.get_writer(path, fps=fps) as writer:
+        for image in images:
+            writer.append_data(image)
+
+
+def _write_gif(path, images, colors, fps):
+    """ Writes RGB images to an animated GIF with PIL, encoding and writing one frame at a time. """
+    # Every state has its own palette entry, so frames are stored with one byte per pixel
+    palette = Image.new('P', (1, 1))
+    palette.putpalette(np.asarray(colors, dtype=np.uint8).ravel().tolist())
+    with open(path, 'wb') as f:
+        for i, image in enumerate(images):
+            frame = Image.fromarray(image).quantize(palette=palette, dither=Image.Dither.NONE)
+            if i == 0:
+                # Screen size, the shared palette and the loop extension
+                header, _ = GifImagePlugin.getheader(frame, None, {'loop': 0, 'optimize': False})
+                f.write(b''.join(header))
+            f.write(b''.join(GifImagePlugin.getdata(frame, duration=1000 // fps)))
+        f.write(b';')
+
+if __name__ == "__main__":
+    from arraygrid import ArrayGrid
+    grid = ArrayGrid(101, 101, beta=0.5, gamma=0.1, neighbours='radius', seed=1)
+    grid.infect(50, 50)
+    export_animation(grid, 'simulations/spread.gif', every=2, scale=4)
@@ -0,0 +1,122 @@
+"""
+Active-frontier variant of the array-backed cellular SIR model.
+
+Only evaluates the cells that can change state: infected and exposed cells,
+and susceptible cells within reach of an infected cell. The cost of a step
+scales with the size of the epidemic front instead of the grid area.
+"""
+import math
+
+import numpy as np
+
+import neighbourhood
+from arraygrid import ArrayGrid, S, I, R, E
+
+
+class FrontierGrid(ArrayGrid):
+    """
+    active-frontier grid object
+
+    Takes the same arguments as Grid, plus:
+        reach (int):        distance at which infected cells can reach susceptible cells
+                            used when neighbours are selected using a gaussian
+                            Default is ceil(5 * SD)
+
+    The frontier is used for the S-based modeltype with radius and gauss
+    neighbours, the other settings step like ArrayGrid.
+    """
+
+    def __init__(self, width, height, *args, **kwargs):
+        """ Initializes the grid object, see Grid for the arguments. """
+        super().__init__(width, height, *args, **kwargs)
+        self.reach = kwargs.get('reach', math.ceil(5 * self.SD))
+        # Indices of the infected and exposed cells, built on the first step
+        self._infected = None
+        self._exposed = None
+        # Number of infected neighbours of every cell, only used in radius mode
+        self._infected_neighbours = None
+
+    def _track(self):
+        """ Builds the active sets and the infected neighbour counts from the state. """
+        current = self.state.ravel()
+        self._infected = np.flatnonzero(current == I)
+        self._exposed = np.flatnonzero(current == E)
+        if self.neighbours == 'radius':
+            self._infected_neighbours = np.zeros(current.size, dtype=np.int32)
+            np.add.at(self._infected_neighbours, self._neighbour_table[self._infected].ravel(), 1)
+
+    def _candidates(self):
+        """ Returns the susceptible cells within reach of an infected cell. """
+        current = self.state.ravel()
+        if self.neighbours == 'radius':
+            reachable = self._neighbour_table[self._infected]
+        elif len(self._infected) * (2 * self.reach + 1) ** 2 < current.size:
+            reachable = neighbourhood.radius_indices(self.width, self.height, self.reach, self._infected)
+        else:
+            # The front covers the grid anyway
+            return np.flatnonzero(current == S)
+        reachable = np.unique(reachable)
+        return reachable[current[reachable] == S]
+
+    def _step_frontier(self):
+        """ Evaluates the active cells only, writing the new states in place. """
+        if self._infected is None:
+            self._track()
+        current = self.state.ravel()
+        # S -> I (or S -> E)
+        candidates = self._candidates()
+        if self.neighbours == 'radius':
+            counts = self._infected_neighbours[candidates]
+        else:
+            counts = (current[self._sample_neighbours(candidates)] == I).sum(axis=1)
+        infections = candidates[self.rng.random(len(candidates)) < self.p_infect * counts]
+        if len(infections):
+            # Make sure there is at least one infection
+            self.has_infected = True
+        # I -> R
+        recovered = np.zeros(len(self._infected), dtype=bool)
+        if self.has_infected:
+            recovered = self.rng.random(len(self._infected)) < self.gamma
+        # E -> I
+        activated = self.rng.random(len(self._exposed)) < self.exposed_phase_threshold
+
+        # All decisions are based on the start of the day, so the state can be written in place
+        current[infections] = I if self.model == 'SIR' else E
+        current[self._infected[recovered]] = R
+        current[self._exposed[activated]] = I
+        self._transition(S, I if self.model == 'SIR' else E, len(infections))
+        self._transition(I, R, np.count_nonzero(recovered))
+        self._transition(E, I, np.count_nonzero(activated))
+        if self.model == 'SIR':
+            new_infected = np.concatenate((infections, self._exposed[activated]))
+            self._exposed = self._exposed[~activated]
+        else:
+            new_infected = self._exposed[activated]
+            self._exposed = np.concatenate((self._exposed[~activated], infections))
+        if self.neighbours == 'radius':
+            # Only the neighbours of cells that changed need their counts updated
+            np.add.at(self._infected_neighbours, self._neighbour_table[new_infected].ravel(), 1)
+            np.subtract.at(self._infected_neighbours, self._neighbour_table[self._infected[recovered]].ravel(), 1)
+        self._infected = np.concatenate((self._infected[~recovered], new_infected))
+        return not len(self._infected)
+
+    def step(self):
+        """ Steps one day ahead. Evaluates the cells on the epidemic front. """
+        if self.modeltype == "S-based" and self.neighbours in ('radius', 'gauss'):
+            return self._step_frontier()
+        return super().step()
+
+    def infect(self, x, y):
+        """ Sets state of cell at x, y to I=infected. """
+        super().infect(x, y)
+        # Rebuild the active sets on the next step
+        self._infected = None
+
+    def kill(self, x, y):
+        """ Sets state of cell at x, y to D=dead. """
+        super().kill(x, y)
+        self._infected = None
+
+
+if __name__ == "__main__":
+    print(FrontierGrid.simulate(201, 201, neighbours='radius', radius=1))
@@ -0,0 +1,225 @@
+"""
+Event-driven, continuous-time variant of the cellular SIR model.
+
+Infections, recoveries and E -> I transitions happen one at a time at
+exponentially distributed times, using the same lattice and neighbour
+tables as the daily grids. While many cells are active, events are
+bundled into tau-leaps. The cost of a run scales with the number of
+events instead of the grid area times the number of days.
+"""
+import numpy as np
+
+from arraygrid import ArrayGrid, S, I, R, E
+
+
+class CellSet:
+    """
+    set of flat cell indices with constant time insertion, removal and sampling
+
+    Attributes:
+        size (int):         number of cells in the grid
+    """
+
+    def __init__(self, size):
+        self.cells = np.empty(size, dtype=np.int64)
+        # Position of every cell in cells, -1 if it is not in the set
+        self.where = np.full(size, -1, dtype=np.int64)
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    def add(self, cell):
+        """ Adds a cell. """
+        self.cells[self.n] = cell
+        self.where[cell] = self.n
+        self.n += 1
+
+    def remove(self, cell):
+        """ Removes a cell, the last cell takes its place. """
+        i = self.where[cell]
+        last = self.cells[self.n - 1]
+        self.cells[i] = last
+        self.where[last] = i
+        self.where[cell] = -1
+        self.n -= 1
+
+    def sample(self, rng):
+        """ Returns a random cell of the set. """
+        return self.cells[rng.integers(self.n)]
+
+    def array(self):
+        """ Returns a view of the cells in the set. """
+        return self.cells[:self.n]
+
+    def replace(self, cells):
+        """ Replaces all cells of the set. """
+        self.where[self.cells[:self.n]] = -1
+        self.n = len(cells)
+        self.cells[:self.n] = cells
+        self.where[cells] = np.arange(self.n)
+
+
+class GillespieGrid(ArrayGrid):
+    """
+    event-driven grid object
+
+    Takes the same arguments as Grid, plus:
+        tau (float):        length of a tau-leap in days
+                            Default is 0.1
+        switch (int):       number of infected and exposed cells from which tau-leaping is used
+                            Default is 100
+
+    Every infected cell infects each susceptible neighbour at rate p_infect
+    per day and recovers at rate gamma, exposed cells turn infected at rate
+    exposed_phase_threshold, the daily chance of the S-based grids. Like the
+    other grids, nobody recovers before the first infection. Only radius and all neighbours are supported, as random and
+    gauss neighbours have no fixed contacts in continuous time, and only
+    the S-based modeltype, as these rates are the S-based model.
+    """
+
+    def __init__(self, width, height, *args, **kwargs):
+        """ Initializes the grid object, see Grid for the arguments. """
+        super().__init__(width, height, *args, **kwargs)
+        if self.neighbours not in ('radius', 'all'):
+            raise ValueError(f"GillespieGrid supports radius and all neighbours, not {self.neighbours}")
+        if self.modeltype != 'S-based':
+            raise ValueError(f"GillespieGrid only supports the S-based modeltype, not {self.modeltype}")
+        self.tau = kwargs.get('tau', 0.1)
+        self.switch = kwargs.get('switch', 100)
+        # Time in days, the start of the current day
+        self.time = 0.0
+        # Sets of infected and exposed cells, built on the first step
+        self._infected = None
+        self._exposed = None
+
+    def _track(self):
+        """ Builds the infected and exposed sets from the state. """
+        current = self.state.ravel()
+        self._infected = CellSet(current.size)
+        self._infected.replace(np.flatnonzero(current == I))
+        self._exposed = CellSet(current.size)
+        self._exposed.replace(np.flatnonzero(current == E))
+
+    def _contacts(self, infectors, columns):
+        """ Returns the contacts of infectors, columns picks one of their nr_of_neighbours neighbours. """
+        if self.neighbours == 'radius':
+            return self._neighbour_table[infectors, columns]
+        # Every other cell is a neighbour
+        return columns + (columns >= infectors)
+
+    def _infect(self, cell):
+        """ Infects (or exposes) a susceptible cell. """
+        current = self.state.ravel()
+        if self.model == 'SIR':
+            current[cell] = I
+            self._infected.add(cell)
+            self._transition(S, I)
+        else:
+            current[cell] = E
+            self._exposed.add(cell)
+            self._transition(S, E)
+
+    def _exact(self, until):
+        """ Simulates one event at a time until the given time, or until tau-leaping takes over. """
+        current = self.state.ravel()
+        infection_rate = self.p_infect * self.nr_of_neighbours
+        activation_rate = self.exposed_phase_threshold
+        while len(self._infected) + len(self._exposed):
+            if len(self._infected) + len(self._exposed) >= self.switch:
+                return
+            # Infection attempts on a random neighbour of an infected cell, recoveries and activations
+            attempts = infection_rate * len(self._infected)
+            # Make sure there is at least one infection before anyone recovers
+            recoveries = self.gamma * len(self._infected) if self.has_infected else 0.0
+            total = attempts + recoveries + activation_rate * len(self._exposed)
+            self.time += self.rng.exponential(1 / total)
+            if self.time >= until:
+                # No event before the end of the day, waiting times are memoryless
+                self.time = until
+                return
+            u = self.rng.random() * total
+            if u < attempts:
+                infector = self._infected.sample(self.rng)
+                target = int(self._contacts(infector, self.rng.integers(self.nr_of_neighbours)))
+                # Attempts on cells that are not susceptible have no effect
+                if current[target] == S:
+                    self._infect(target)
+                    self.has_infected = True
+            elif u < attempts + recoveries:
+                cell = self._infected.sample(self.rng)
+                current[cell] = R
+                self._infected.remove(cell)
+                self._transition(I, R)
+            else:
+                cell = self._exposed.sample(self.rng)
+                current[cell] = I
+                self._exposed.remove(cell)
+                self._infected.add(cell)
+                self._transition(E, I)
+
+    def _leap(self, tau):
+        """ Fires all events of the next tau days at once, based on the state at the start of the leap. """
+        current = self.state.ravel()
+        infected = self._infected.array().copy()
+        exposed = self._exposed.array().copy()
+        # S -> I (or S -> E), the number of attempts of every infected cell is Poisson distributed
+        attempts = self.rng.poisson(self.p_infect * self.nr_of_neighbours * tau, len(infected))
+        infectors = np.repeat(infected, attempts)
+        targets = self._contacts(infectors, self.rng.integers(self.nr_of_neighbours, size=len(infectors)))
+        # Cells hit by several attempts are infected once
+        infections = np.unique(targets[current[targets] == S])
+        if len(infections):
+            # Make sure there is at least one infection
+            self.has_infected = True
+        # I -> R
+        recovered = self.rng.random(len(infected)) < -np.expm1(-self.gamma * tau)
+        if not self.has_infected:
+            recovered[:] = False
+        # E -> I
+        activated = self.rng.random(len(exposed)) < -np.expm1(-self.exposed_phase_threshold * tau)
+
+        current[infections] = I if self.model == 'SIR' else E
+        current[infected[recovered]] = R
+        current[exposed[activated]] = I
+        self._transition(S, I if self.model == 'SIR' else E, len(infections))
+        self._transition(I, R, np.count_nonzero(recovered))
+        self._transition(E, I, np.count_nonzero(activated))
+        new_infected = exposed[activated]
+        new_exposed = exposed[~activated]
+        if self.model == 'SIR':
+            new_infected = np.concatenate((new_infected, infections))
+        else:
+            new_exposed = np.concatenate((new_exposed, infections))
+        self._infected.replace(np.concatenate((infected[~recovered], new_infected)))
+        self._exposed.replace(new_exposed)
+
+    def step(self):
+        """ Steps one day ahead, simulating every event up to the start of the next day. """
+        if self._infected is None:
+            self._track()
+        until = np.floor(self.time) + 1
+        while self.time < until and len(self._infected) + len(self._exposed):
+            if len(self._infected) + len(self._exposed) >= self.switch:
+                tau = min(self.tau, until - self.time)
+                self._leap(tau)
+                self.time += tau
+            else:
+                self._exact(until)
+        self.time = until
+        return not (len(self._infected) + len(self._exposed))
+
+    def infect(self, x, y):
+        """ Sets state of cell at x, y to I=infected. """
+        super().infect(x, y)
+        # Rebuild the active sets on the next step
+        self._infected = None
+
+    def kill(self, x, y):
+        """ Sets state of cell at x, y to D=dead. """
+        super().kill(x, y)
+        self._infected = None
+
+
+if __name__ == "__main__":
+    print(GillespieGrid.simulate(201, 201, beta=0.5, gamma=0.1, neighbours='radius', radius=1))
@@ -1,14 +1,113 @@
-import copy
-import random
+import time
+
 import numpy as np
+import pandas as pd
 
 
 from IPython import get_ipython
 from IPython.display import display, clear_output
 
 import cell
+import eventlog
+import neighbourhood
 import matplotlib.pyplot as plt
 
+from cell import COMPARTMENTS
+
+
+class History:
+    """
+    Growable buffer of daily compartment counts
+
+    Attributes:
+        model (str):        compartments to record, e.g. SIR
+        capacity (int):     number of days to preallocate, doubled when full
+        dtype (type):       type of the counts, float for models with fractional counts
+    """
+
+    def __init__(self, model="SIR", capacity=128, dtype=np.int64):
+        self.model = model
+        self.columns = [COMPARTMENTS.index(k) for k in model]
+        self.data = np.zeros((capacity, len(model)), dtype=dtype)
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def append(self, counts):
+        """ Records one day, counts holds the count of every compartment in COMPARTMENTS. """
+        if self.length == len(self.data):
+            self.data = np.concatenate((self.data, np.zeros_like(self.data)))
+        self.data[self.length] = counts[self.columns]
+        self.length += 1
+
+    def last(self):
+        """ Returns a dict with the counts of the last recorded day. """
+        return dict(zip(self.model, self.data[self.length - 1].tolist()))
+
+    def to_dict(self):
+        """ Returns a dict with an array of daily counts per compartment. """
+        return {k: self.data[:self.length, i] for i, k in enumerate(self.model)}
+
+    def to_frame(self):
+        """ Returns a DataFrame with a column of daily counts per compartment. """
+        return pd.DataFrame(self.data[:self.length], columns=list(self.model))
+
+
+class CellHistory:
+    """
+    Growable buffer of the daily state indicators of every cell
+
+    Attributes:
+        shape (tuple):      width and height of the grid
+        path (str):         file the buffer is memory-mapped to, default is None to keep it in memory
+        capacity (int):     number of days to preallocate, doubled when full
+    """
+
+    def __init__(self, shape, path=None, capacity=64):
+        self.shape = tuple(shape)
+        self.path = path
+        self.length = 0
+        if path is not None:
+            # Start from an empty file
+            open(path, 'wb').close()
+        self.data = self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        """ Returns a buffer for capacity days, holding the days recorded so far. """
+        shape = (capacity,) + self.shape
+        if self.path is None:
+            data = np.zeros(shape, dtype=np.uint8)
+            if self.length:
+                data[:self.length] = self.data[:self.length]
+            return data
+        # Growing the file keeps the recorded days in place
+        with open(self.path, 'r+b') as f:
+            f.truncate(int(np.prod(shape)))
+        return np.memmap(self.path, dtype=np.uint8, mode='r+', shape=shape)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, day):
+        """ Returns the state indicators of all cells on a recorded day. """
+        return self.data[:self.length][day]
+
+    def append(self, state):
+        """ Records the state indicators of all cells for one day. """
+        if self.length == len(self.data):
+            self.data = self._allocate(2 * len(self.data))
+        self.data[self.length] = state
+        self.length += 1
+
+    def cell(self, x, y):
+        """ Returns the state indicators of the cell at x, y on every recorded day. """
+        return self.data[:self.length, x, y]
+
+    def to_array(self):
+        """ Returns a (days, width, height) array of state indicators. """
+        return self.data[:self.length]
+
 
 class Grid:
     """
@@ -66,6 +165,13 @@ class Grid:
                                 used when neighbours are selected randomly
             SD (int):           standard deviation of the gaussian
                                 used when neighoubrs are selected randomly using a gaussian
+            seed (int, SeedSequence or Generator): seed of the random number generator
+                                runs with the same seed are identical, default is a fresh seed
+            cell_history (bool or str): record the state of every cell on every timestep of run
+                                a file name memory-maps the record to that file, default is False
+            event_log (bool or str): log every state change during run in self.event_log, which
+                                can be saved with event_log.save, a file name saves the log
+                                to that file when the run is over, default is False
         """
         self.width = width
         self.height = height
@@ -94,21 +200,60 @@ class Grid:
             self.nr_of_neighbours = ((self.radius * 2 + 1) ** 2) - 1
         self.SD = kwargs.get('SD', self.width)
 
+        # Random number generator used for sampling, transitions and seeding
+        self.rng = np.random.default_rng(kwargs.get('seed'))
+
+        # Radius neighbourhoods never change, so they are looked up in a shared table
+        self._neighbour_table = None
+        if self.neighbours == 'radius':
+            self._neighbour_table = neighbourhood.radius_table(width, height, self.radius)
+
         # Compute relevant infection probability
         self.p_infect = self.beta / self.nr_of_neighbours
 
         self.model_type = kwargs.get('model_type', 'SIR')
 
-        # create list of Cells, with x and y coordinates
-        self.cell_list = [[] for _ in range(self.width)]
-        for col in range(width):
-            for row in range(height):
-                self.cell_list[col].append(cell.Cell(col, row, self))
-
         # self.agg_compartments[0][0] = width * height
 
         self.has_infected = False
 
+        # Double buffered state indicators, step writes into _next and swaps it with state
+        self.state = np.zeros((self.width, self.height), dtype=np.uint8)
+        self._next = np.zeros_like(self.state)
+        # Count of every compartment, updated with every transition
+        self.counts = np.zeros(len(COMPARTMENTS), dtype=np.int64)
+        self.counts[COMPARTMENTS.index('S')] = width * height
+        # Daily state indicators of every cell, only recorded on request
+        self.cell_history = None
+        cell_history = kwargs.get('cell_history', False)
+        if cell_history:
+            self.cell_history = CellHistory(self.state.shape, None if cell_history is True else cell_history)
+        # Log of all state changes, only recorded on request
+        self.event_log = None
+        event_log = kwargs.get('event_log', False)
+        if event_log:
+            self.event_log = eventlog.EventLog(self.state.shape)
+        self.event_log_path = None if event_log is True else event_log or None
+
+        self._create_cells()
+
+    def _transition(self, old, new, n=1):
+        """ Moves n cells from state indicator old to new in the counts. """
+        self.counts[old] -= n
+        self.counts[new] += n
+
+    def _set_state(self, x, y, state):
+        """ Sets the state indicator of the cell at x, y. """
+        self._transition(self.state[x, y], state)
+        self.state[x, y] = state
+
+    def _create_cells(self):
+        """ Creates the list of Cells, with x and y coordinates. """
+        self.cell_list = [[] for _ in range(self.width)]
+        for col in range(self.width):
+            for row in range(self.height):
+                self.cell_list[col].append(cell.Cell(col, row, self))
+
     def get_neighbours(self, x, y):
         """ Returns a list of coordinates of cells neighbouring the cell at x, y. """
         if self.neighbours == 'radius':
@@ -120,40 +265,24 @@ class Grid:
 
     def _get_neighbours_in_radius(self, x, y, radius):
         """ Returns a list of coordinates of cells neighbouring the cell at x, y. """
-        neigh = []
-        for col in range(x - radius, x + radius + 1):
-            for row in range(y - radius, y + radius + 1):
-                # Skip center
-                if col == x and row == y:
-                    continue
-                # Append neighbour
-                # Modulo makes the grid loop around so we don't have to worry about border cases.
-                neigh.append((col % self.width, row % self.height))
-        return neigh
+        neigh = neighbourhood.radius_table(self.width, self.height, radius)[x * self.height + y]
+        return [divmod(int(i), self.height) for i in neigh]
 
     def _get_neighbours_randomly(self, x, y, nr_of_neighbours):
         """ Returns a list of randomly sampled neighbours where each cell has an equal chance of being sampled. """
-        neigh = []
-        while len(neigh) < nr_of_neighbours:
-            col = random.randint(0, self.width-1)
-            row = random.randint(0, self.height-1)
-            if (col, row) == (x, y) or (col, row) in neigh:
-                continue
-            else:
-                neigh.append((col, row))
-        return neigh
+        neigh = neighbourhood.sample_random(self.rng, self.width, self.height, np.array([x * self.height + y]), nr_of_neighbours)[0]
+        return [divmod(int(i), self.height) for i in neigh]
 
     def _get_neighbours_gaussian(self, x, y, nr_of_neighbours, SD=2):
         """ Returns a list of randomly sampled neighbours where cells closer to x,y have a higher chance of being sampled. """
-        neigh = []
-        while len(neigh) < nr_of_neighbours:
-            col = (x + int(random.gauss(0, SD))) % (self.width)
-            row = (y + int(random.gauss(0, SD))) % (self.height)
-            if (col, row) == (x, y) or (col, row) in neigh:
-                continue
-            else:
-                neigh.append((col, row))
-        return neigh
+        neigh = neighbourhood.sample_gauss(self.rng, self.width, self.height, np.array([x * self.height + y]), nr_of_neighbours, SD)[0]
+        return [divmod(int(i), self.height) for i in neigh]
+
+    def _sample_neighbours(self, idx):
+        """ Samples the neighbours of every cell in idx at once, returns an array of flat indices. """
+        if self.neighbours == 'random':
+            return neighbourhood.sample_random(self.rng, self.width, self.height, idx, self.nr_of_neighbours)
+        return neighbourhood.sample_gauss(self.rng, self.width, self.height, idx, self.nr_of_neighbours, self.SD)
 
     def get_dist(self, a, b):
         """ Computes the distance between point a and point b. """
@@ -168,21 +297,21 @@ class Grid:
         state = self.cell_list[x][y].compartment
         # If state is recovered, no further computing is needed
         if state == 'R':
-            self.cell_list[x][y].compartment_table.append(state)
             return 'R'
         # Set initial counts to 0
         neighbor_states = {'S': 0, 'I': 0, 'R': 0, 'E': 0}
         # Count states of neighbours
         if self.neighbours == 'all':
-            for c in range(self.width):
-                for r in range(self.height):
-                    if (c, r) != (x, y):
-                        neighbor_states[self.cell_list[c][r].compartment] += 1
+            # Every cell sees the whole grid minus itself, counted once per step
+            neighbor_states = dict(zip(COMPARTMENTS, self._counts.tolist()))
+            neighbor_states[state] -= 1
         else:
-            for x, y in self.get_neighbours(x, y):
-                neighbor_states[self.cell_list[x][y].compartment] += 1
+            # Gather neighbour states from the neighbour table
+            neighbours = self._neighbour_table[x * self.height + y]
+            counts = np.bincount(self.state.ravel()[neighbours], minlength=len(COMPARTMENTS))
+            neighbor_states = dict(zip(COMPARTMENTS, counts.tolist()))
         # Get random number
-        chance = random.random()
+        chance = self.rng.random()
         # Return evaluated state
         if state == 'S' and chance < self.p_infect * neighbor_states['I']:
             # Make sure there is at least one infection
@@ -204,39 +333,30 @@ class Grid:
         state = self.cell_list[x][y].compartment
 
         if state == "I":
-            if random.random() < self.gamma:
+            if self.rng.random() < self.gamma:
                 transition = True
             else:
                 transition = False
 
-            if 1 <= self.beta:
-                infect_count = np.floor(self.beta)
-            else:
-                infect_count = 0
-
-            if random.random() < self.beta % 1:
-                infect_count += 1
+            # floor(beta) targets, plus one more with chance beta % 1
+            infect_count = int(self.beta) + int(self.rng.random() < self.beta % 1)
 
-            neighbourlist = []
             if self.neighbours == 'all':
-                for c in range(self.width):
-                    for r in range(self.height):
-                        if (c, r) != (x, y) and self.cell_list[c][r].compartment == 'S':
-                            neighbourlist.append((c, r))
-            else:
-                for x, y in self.get_neighbours(x, y):
-                    if self.cell_list[x][y].compartment == 'S':
-                        neighbourlist.append((x, y))
-
-            if not neighbourlist:
-                return transition, []
-            elif len(neighbourlist) > infect_count:
-                for _ in range(len(neighbourlist) - infect_count):
-                    neighbourlist.remove(random.choice(neighbourlist))
-            return transition, neighbourlist
+                # Susceptible cells are collected once per step, sample the targets directly
+                if not self._susceptible:
+                    return transition, []
+                targets = self.rng.choice(len(self._susceptible), min(infect_count, len(self._susceptible)), replace=False)
+                return transition, [self._susceptible[i] for i in targets]
+
+            # Gather susceptible neighbours from the neighbour table
+            neighbours = self._neighbour_table[x * self.height + y]
+            neighbours = neighbours[self.state.ravel()[neighbours] == COMPARTMENTS.index('S')]
+            if len(neighbours) > infect_count:
+                neighbours = self.rng.choice(neighbours, infect_count, replace=False)
+            return transition, [divmod(int(i), self.height) for i in neighbours]
 
         elif state == "E":
-            if random.random() < self.delta:
+            if self.rng.random() < self.delta:
                 transition = True
             else:
                 transition = False
@@ -246,8 +366,17 @@ class Grid:
         """ Steps one day ahead. Evaluates the state of all cells in the grid. """
         # Boolean to indicate no more infected cells
         done = True
-        # Copy grid so updating of cells doesn't affect neighbor states
-        temp = copy.deepcopy(self.cell_list)
+        # Write into the next buffer so updating of cells doesn't affect neighbor states
+        self._next[:] = self.state
+        if self.neighbours == 'all':
+            # Counts at the start of the day, instead of counting once per cell
+            self._counts = self.counts.copy()
+            if self.modeltype != 'S-based':
+                # Only the I-based cell behaviour picks its targets among the susceptible cells
+                self._susceptible = [divmod(int(i), self.height) for i in np.flatnonzero(self.state.ravel() == COMPARTMENTS.index('S'))]
+        elif self.neighbours in ('random', 'gauss'):
+            # Sample the neighbours of all cells for this step at once
+            self._neighbour_table = self._sample_neighbours(np.arange(self.width * self.height))
         # new_agg_day = [0] * len(self.model_type)
         for col in range(self.width):
             for row in range(self.height):
@@ -255,30 +384,36 @@ class Grid:
                     new_state = self.evaluate_cell(col, row)
                     if new_state == 'I':
                         done = False
-                    temp[col][row].compartment = new_state
-                    temp[col][row].add_compartment_day(temp[col][row].compartment)
+                    if COMPARTMENTS.index(new_state) != self.state[col, row]:
+                        self._transition(self.state[col, row], COMPARTMENTS.index(new_state))
+                    self._next[col, row] = COMPARTMENTS.index(new_state)
                 else:
                     if self.cell_list[col][row].compartment == 'I':
                         transition, neighbours = self.cell_behaviour(col, row)
                         if len(neighbours) > 0:
                             done = False
                         if transition:
-                            temp[col][row].compartment = 'R'
+                            self._next[col, row] = COMPARTMENTS.index('R')
+                            self._transition(COMPARTMENTS.index('I'), COMPARTMENTS.index('R'))
                         else:
                             done = False
                         if neighbours:
                             for (nc, nr) in neighbours:
-                                if temp[nc][nr].compartment == 'S' and self.model == 'SIR':
-                                    temp[nc][nr].compartment = 'I'
-                                elif temp[nc][nr].compartment == 'S' and self.model == 'SEIR':
-                                    temp[nc][nr].compartment = 'E'
+                                if COMPARTMENTS[self._next[nc, nr]] == 'S' and self.model == 'SIR':
+                                    self._next[nc, nr] = COMPARTMENTS.index('I')
+                                    self._transition(COMPARTMENTS.index('S'), COMPARTMENTS.index('I'))
+                                elif COMPARTMENTS[self._next[nc, nr]] == 'S' and self.model == 'SEIR':
+                                    self._next[nc, nr] = COMPARTMENTS.index('E')
+                                    self._transition(COMPARTMENTS.index('S'), COMPARTMENTS.index('E'))
                     elif self.cell_list[col][row].compartment == 'E':
                         transition, _ = self.cell_behaviour(col, row)
                         if transition:
-                            temp[col][row].compartment = 'I'
+                            self._next[col, row] = COMPARTMENTS.index('I')
+                            self._transition(COMPARTMENTS.index('E'), COMPARTMENTS.index('I'))
                             done = False
 
-        self.cell_list = temp
+        # Swap buffers, the cells read their compartment from self.state
+        self.state, self._next = self._next, self.state
         return done
 
     def infect(self, x, y):
@@ -291,51 +426,74 @@ class Grid:
 
     def get_states(self):
         """ Returns a grid of state indicators. """
-        classes = ['S', 'I', 'R', 'E']
         states = [[] for _ in range(self.width)]
         for col in range(self.width):
             for row in range(self.height):
-                states[col].append(classes.index(self.cell_list[col][row].compartment))
+                states[col].append(COMPARTMENTS.index(self.cell_list[col][row].compartment))
         return states
 
     def count_states(self, model="SIR"):
         """ Returns a dict with a count of each state. """
-        states = {k: 0 for k in model}
-        for col in range(self.width):
-            for row in range(self.height):
-                states[self.cell_list[col][row].compartment] += 1
-        return states
+        return {k: int(self.counts[COMPARTMENTS.index(k)]) for k in model}
 
-    def run(self, verbose=False, model="SIR"):
-        """ Runs simulation until no more cells are infected. """
-        # Construct dict to store state history in.
-        history = {k: [] for k in model}
-        # Step through until pandemic is over.
+    def iter_run(self, model="SIR", snapshots=0, verbose=False, interval=1.0):
+        """
+        Runs simulation until no more cells are infected, yielding every timestep as it goes.
+
+        Yields (timestep, counts, snapshot) tuples, counts is a dict with a
+        count of each state in model. With snapshots=n, snapshot is a copy of
+        the state indicators every n timesteps and None otherwise. Stop
+        iterating to end the run early. If verbose, progress is reported at
+        most once every interval seconds.
+        """
+        timestep = 0
+        reported = time.monotonic()
         done = False
-        while not done:
-            # Record state
-            history = {k: history[k] + [v] for k, v in self.count_states(model).items()}
+        while True:
+            snapshot = None
+            if snapshots and timestep % snapshots == 0:
+                snapshot = self.state.copy()
+            if self.cell_history is not None:
+                self.cell_history.append(self.state)
+            if self.event_log is not None:
+                self.event_log.append(self.state)
+            yield timestep, self.count_states(model), snapshot
+            # Report at the end and whenever enough time has passed
+            if verbose and (done or time.monotonic() - reported >= interval):
+                self.report(timestep, model)
+                reported = time.monotonic()
+            if done:
+                if self.event_log_path is not None:
+                    self.event_log.save(self.event_log_path)
+                return
             # Go to next step
             done = self.step()
-            # Update state if verbose
-            if verbose:
-                message = f"[Timestep {len(history['S'])-1:3d}] " + "".join([f"{k}: {v[-1]:3d} " for k, v in history.items()])
-                if self.in_notebook:
-                    clear_output(wait=True)
-                    display(message)
-                else:
-                    print(message, end="\r")
-        # Final history update
-        history = {k: history[k] + [v] for k, v in self.count_states(model).items()}
-        # Return history
-        return history
+            timestep += 1
+
+    def report(self, timestep, model="SIR"):
+        """ Shows the counts of the current timestep. """
+        message = f"[Timestep {timestep:3d}] " + "".join([f"{k}: {v:3.0f} " for k, v in self.count_states(model).items()])
+        if self.in_notebook():
+            clear_output(wait=True)
+            display(message)
+        else:
+            print(message, end="\r")
+
+    def run(self, verbose=False, model="SIR"):
+        """ Runs simulation until no more cells are infected. Returns a dict with an array of daily counts per state. """
+        # Preallocated buffer to store state history in.
+        history = History(model)
+        for _ in self.iter_run(model, verbose=verbose):
+            history.append(self.counts)
+        return history.to_dict()
 
     @staticmethod
     def in_notebook():
         try:
             if 'IPKernelApp' not in get_ipython().config:
                 return False
-        except ImportError:
+        except (ImportError, AttributeError):
+            # get_ipython returns None outside of IPython
             return False
         return True
 
@@ -347,7 +505,7 @@ class Grid:
         # Randomly infect
         infected = 0
         while infected < grid.infected:
-            x, y = random.randint(0, grid.width-1), random.randint(0, grid.height-1)
+            x, y = int(grid.rng.integers(grid.width)), int(grid.rng.integers(grid.height))
             if (x, y) not in modified:
                 grid.infect(x, y)
                 modified.append((x, y))
@@ -355,7 +513,7 @@ class Grid:
         # Randomly kill
         dead = 0
         while dead < grid.dead:
-            x, y = random.randint(0, grid.width-1), random.randint(0, grid.height-1)
+            x, y = int(grid.rng.integers(grid.width)), int(grid.rng.integers(grid.height))
             if (x, y) not in modified:
                 grid.kill(x, y)
                 modified.append((x, y))
@@ -0,0 +1,195 @@
+"""
+Hybrid stochastic / deterministic variant of the mean-field cellular SIR model.
+
+With neighbours='all' every cell sees the same number of infected cells,
+so the state of the grid is fully described by the compartment counts.
+While few people are infected the counts are stepped stochastically, like
+ArrayGrid does. Once the outbreak is large, the counts follow an Euler step
+of SIR.derivatives instead, with the N - 1 contacts of every cell and the
+daily rates capped at one like the probabilities of the stochastic step.
+The run switches back to the stochastic step for the fade-out. Runs of
+city-scale populations take as long as runs of a few hundred people.
+"""
+import time
+
+import numpy as np
+
+import SIR
+from grid import Grid, History, COMPARTMENTS
+from arraygrid import S, I, R, E, D
+
+# Approximations of the daily flows in the bulk phase
+BULK = ('ode', 'diffusion')
+
+
+class HybridGrid:
+    """
+    hybrid grid object
+
+    Takes the same arguments as Grid, plus:
+        threshold (int):    number of infected people from which the bulk dynamics are used
+                            Default is 1000
+        bulk (str):         'ode' for the expected flows of SIR.SIR, 'diffusion' to add the
+                            gaussian fluctuations of the stochastic step to them
+                            Default is ode
+
+    Only the S-based modeltype with all neighbours is supported, as the
+    counts describe the grid only when all cells are each other's neighbours.
+    """
+
+    def __init__(self,
+                 width,
+                 height,
+                 R_0 = 0,
+                 gamma = 0.053,
+                 recovered = 0,
+                 beta = 0.152,
+                 infected = 1,
+                 rho = 0.0,
+                 dead = 0,
+                 delta = 0.2,
+                 neighbours='all',
+                 model='SIR',
+                 modeltype = 'S-based',
+                 **kwargs):
+        """ Initializes the counts with susceptible people only, see Grid for the arguments. """
+        if neighbours != 'all' or modeltype != 'S-based':
+            raise ValueError("HybridGrid only supports the S-based modeltype with all neighbours")
+        self.width = width
+        self.height = height
+        self.gamma = gamma
+        self.beta = beta
+        self.infected = infected
+        self.dead = dead
+        self.model = model
+        self.exposed_phase_threshold = 5.2
+        self.threshold = kwargs.get('threshold', 1000)
+        self.bulk = kwargs.get('bulk', 'ode')
+        if self.bulk not in BULK:
+            raise ValueError(f"Choose a valid bulk approximation ({', '.join(BULK)}), not {self.bulk}")
+        self.population = width * height
+        self.p_infect = self.beta / (self.population - 1)
+        self.rng = np.random.default_rng(kwargs.get('seed'))
+        self.has_infected = False
+        # Count of every compartment, fractional in the bulk phase
+        self.counts = np.zeros(len(COMPARTMENTS))
+        self.counts[S] = self.population
+        # Whether the counts are whole numbers, for the stochastic step
+        self.integral = True
+
+    def infect(self, n=1):
+        """ Infects n susceptible people. """
+        self.counts[[S, I]] += (-n, n)
+
+    def kill(self, n=1):
+        """ Kills n susceptible people. """
+        self.counts[[S, D]] += (-n, n)
+
+    def _flows(self, infections, recoveries, activations):
+        """ Applies the daily number of people moving between compartments. """
+        self.counts[S] -= infections
+        if self.model == 'SIR':
+            self.counts[I] += infections
+        else:
+            self.counts[E] += infections
+        self.counts[[I, R]] += (-recoveries, recoveries)
+        self.counts[[E, I]] += (-activations, activations)
+
+    def _round(self):
+        """ Rounds fractional counts up or down at random, keeping the population fixed. """
+        counts = np.floor(self.counts)
+        counts += self.rng.random(len(counts)) < self.counts - counts
+        counts[R] = self.population - counts.sum() + counts[R]
+        self.counts = counts
+        self.integral = True
+
+    def _step_stochastic(self):
+        """ Draws the daily flows, every susceptible person has the same chance of getting infected. """
+        if not self.integral:
+            self._round()
+        counts = self.counts.astype(np.int64)
+        infections = self.rng.binomial(counts[S], min(1.0, self.p_infect * counts[I]))
+        if infections:
+            # Make sure there is at least one infection
+            self.has_infected = True
+        recoveries = self.rng.binomial(counts[I], min(1.0, self.gamma)) if self.has_infected else 0
+        activations = self.rng.binomial(counts[E], min(1.0, self.exposed_phase_threshold))
+        self._flows(infections, recoveries, activations)
+
+    def _step_bulk(self):
+        """ Applies the expected daily flows, with gaussian fluctuations for the diffusion approximation. """
+        self.has_infected = True
+        self.integral = False
+        # SIR.derivatives orders the compartments S, E, I, R, D
+        y = self.counts[[S, E, I, R, D]]
+        beta = min(self.beta, (self.population - 1) / self.counts[I])
+        gamma, delta = min(1.0, self.gamma), min(1.0, self.exposed_phase_threshold)
+        model = 'SIR' if self.model == 'SIR' else 'SEIR'
+        expected = SIR.euler_step(lambda y: SIR.derivatives(y, beta, gamma, delta, 0, 0, self.population - 1, model), y)
+        infections = y[0] - expected[0]
+        recoveries = expected[3] - y[3]
+        activations = y[1] + infections - expected[1] if model == 'SEIR' else 0.0
+        flows = np.array([infections, recoveries, activations])
+        if self.bulk == 'diffusion':
+            n = self.counts[[S, I, E]]
+            p = np.clip(np.divide(flows, n, out=np.zeros(3), where=n > 0), 0, 1)
+            flows = np.clip(flows + np.sqrt(n * p * (1 - p)) * self.rng.standard_normal(3), 0, n)
+        self._flows(*flows)
+
+    def step(self):
+        """ Steps one day ahead. Uses the bulk dynamics while at least threshold people are infected. """
+        if self.counts[I] >= self.threshold:
+            self._step_bulk()
+        else:
+            self._step_stochastic()
+        return self.counts[I] < 0.5
+
+    def count_states(self, model="SIR"):
+        """ Returns a dict with a count of each state. """
+        return {k: self.counts[COMPARTMENTS.index(k)] for k in model}
+
+    def iter_run(self, model="SIR", verbose=False, interval=1.0):
+        """
+        Runs simulation until no more people are infected, yielding every timestep as it goes.
+
+        Yields (timestep, counts, None) tuples like Grid.iter_run, there are no
+        snapshots of the cells. If verbose, progress is reported at most once
+        every interval seconds.
+        """
+        timestep = 0
+        reported = time.monotonic()
+        done = False
+        while True:
+            yield timestep, self.count_states(model), None
+            # Report at the end and whenever enough time has passed
+            if verbose and (done or time.monotonic() - reported >= interval):
+                self.report(timestep, model)
+                reported = time.monotonic()
+            if done:
+                return
+            done = self.step()
+            timestep += 1
+
+    # Progress is shown like Grid does
+    report = Grid.report
+    in_notebook = staticmethod(Grid.in_notebook)
+
+    def run(self, verbose=False, model="SIR"):
+        """ Runs simulation until no more people are infected. Returns a dict with an array of daily counts per state. """
+        history = History(model, dtype=float)
+        for _ in self.iter_run(model, verbose=verbose):
+            history.append(self.counts)
+        return history.to_dict()
+
+    @classmethod
+    def simulate(cls, *args, verbose=False, model='SIR', **kwargs):
+        """ Runs a full simulation. """
+        grid = cls(*args, **kwargs)
+        grid.infect(grid.infected)
+        grid.kill(grid.dead)
+        return grid.run(verbose, model)
+
+
+if __name__ == "__main__":
+    # Population of Wuhan
+    print(HybridGrid.simulate(3350, 3350, beta=0.5, gamma=0.2, verbose=True)['R'][-1])
@@ -1,7 +1,6 @@
 
 import math
 import numpy as np
-import pandas as pd
 import seaborn as sn
 
 import matplotlib
@@ -38,25 +37,35 @@ class CellViz(Canvas):
         height = self.cw*rows if outline == '' else self.cw*rows + 1
         super().__init__(master, width=width, height=height, highlightthickness=0, **kwargs)
         self.cells = None
+        # Values of the cells as currently drawn, indexed [x, y]
+        self.drawn = None
+        # Color of every value drawn so far
+        self._fills = {}
+
+    def fill(self, value):
+        """ Returns the color of a cell value. """
+        if value not in self._fills:
+            # Compute color if colors is not specified
+            self._fills[value] = self.int2color(value) if self.colors is None else self.colors[value]
+        return self._fills[value]
 
     def start(self):
         """ Draws grid based on cell values. """
-        data = pd.DataFrame(np.zeros((self.cols, self.rows), dtype=int))
+        self.drawn = np.zeros((self.cols, self.rows), dtype=int)
 
         self.cells = [[] for _ in range(self.rows)]
         for y in range(self.rows):
             for x in range(self.cols):
-                c = self.int2color(data.iloc[x, y]) if self.colors is None else self.colors[data.iloc[x, y]]
+                c = self.fill(0)
                 cell = self.create_rectangle([x*self.cw, y*self.cw, (x+1)*self.cw, (y+1)*self.cw], fill=c, outline=self.outline)
                 self.cells[y].append(cell)
 
     def update(self, data):
-        """ Updates the grid. """
-        for y, row in enumerate(self.cells):
-            for x, cell in enumerate(row):
-                # Compute color if colors is not specified
-                c = self.int2color(data.iloc[x, y]) if self.colors is None else self.colors[data.iloc[x, y]]
-                self.itemconfig(cell, fill=c, outline=self.outline)
+        """ Updates the grid. Only redraws the cells that changed since the last update. """
+        data = np.asarray(data)
+        for x, y in np.argwhere(data != self.drawn).tolist():
+            self.itemconfig(self.cells[y][x], fill=self.fill(int(data[x, y])))
+        self.drawn = data.copy()
     
     @staticmethod
     def int2color(value):
@@ -67,6 +76,52 @@ class CellViz(Canvas):
         return "#%02x%02x%02x" % (r, g, b)
 
 
+class RasterViz(CellViz):
+    """
+    Custom class used to visualize cell states of large cellular automata.
+
+    Takes the same arguments as CellViz, but draws all cells as one image
+    scaled to pref_width, instead of one rectangle per cell. Cell outlines
+    are not drawn.
+    """
+
+    def __init__(self, master, cols=50, rows=30, pref_width=345, colors=None, outline='', **kwargs):
+        """
+        A widget to visualize large Cellular Automata.
+        """
+        super().__init__(master, cols, rows, pref_width, colors, '', **kwargs)
+        width = pref_width
+        height = max(1, rows * pref_width // cols)
+        self.configure(width=width, height=height)
+        # Cell shown by every pixel column and row, nearest neighbour scaling
+        self.xs = np.arange(width) * cols // width
+        self.ys = np.arange(height) * rows // height
+        self.image = None
+        # RGB color of every value drawn so far
+        self.lut = np.zeros((0, 3), dtype=np.uint8)
+
+    def start(self):
+        """ Creates the image the cells are drawn in. """
+        self.image = PhotoImage(master=self, width=int(self['width']), height=int(self['height']))
+        self.create_image(0, 0, image=self.image, anchor=NW)
+        self.drawn = None
+
+    def rgb(self, value):
+        """ Returns the RGB color of a cell value. """
+        return [c >> 8 for c in self.winfo_rgb(self.fill(value))]
+
+    def update(self, data):
+        """ Updates the grid. Converts the cell values to one RGB image and draws it at once. """
+        data = np.asarray(data)
+        if data.max() >= len(self.lut):
+            self.lut = np.array([self.rgb(v) for v in range(int(data.max()) + 1)], dtype=np.uint8)
+        # Image rows are grid rows
+        pixels = self.lut[data[self.xs[None, :], self.ys[:, None]]]
+        header = f'P6 {pixels.shape[1]} {pixels.shape[0]} 255\n'.encode()
+        self.image.configure(data=header + pixels.tobytes(), format='PPM')
+        self.drawn = data
+
+
 class Plot(Frame):
     """
     Custom class used to visualize plots.
@@ -5,11 +5,12 @@ SIR as a Cellular Automaton
 This code is part of a project for the course Natural Computing.
 """
 import numpy as np
-import pandas as pd
 
 from tkinter import *
-from interface import CellViz
-from grid import Grid
+from interface import CellViz, RasterViz
+from grid import Grid, COMPARTMENTS
+from arraygrid import ArrayGrid
+from eventlog import Replay
 
 import matplotlib.pyplot as plt
 
@@ -18,12 +19,25 @@ class SIRGui:
     FRAME_RATE = 1000 // 5          # Miliseconds per frame
     state_counts = []
 
-    def __init__(self, rows, cols, mode='auto', **kwargs):
-        """ Constructs a window in which visualisation will take place. """
+    def __init__(self, rows, cols, mode='auto', replay=None, renderer='cells', engine=None, **kwargs):
+        """
+        Constructs a window in which visualisation will take place.
+
+        renderer is 'cells' to draw every cell as a rectangle, or 'raster' to
+        draw the grid as one image, which keeps up with much larger grids.
+        engine is the grid class of runs that are not replays, e.g. ArrayGrid
+        or FrontierGrid. Default is ArrayGrid for the raster renderer, as the
+        Cell objects of Grid are too slow for large grids, and Grid otherwise.
+        """
         # Store rows and cols
         self.rows = rows
         self.cols = cols
         self.kwargs = kwargs
+        # Event log of a recorded run to play back instead of simulating
+        self.replay = replay
+        if engine is None:
+            engine = ArrayGrid if renderer == 'raster' else Grid
+        self.engine = engine
 
         # Create window
         self.window = Tk()
@@ -34,7 +48,8 @@ class SIRGui:
         self.window.configure(background='#3d3d3d')
 
         # Add canvas
-        self.cvs = CellViz(self.window, cols, rows, 720, colors=['gray', 'red', 'green'], outline='gray')
+        viz = RasterViz if renderer == 'raster' else CellViz
+        self.cvs = viz(self.window, cols, rows, 720, colors=['gray', 'red', 'green'], outline='gray')
         self.cvs.grid(column=0, row=0)
 
         # Show window
@@ -45,24 +60,25 @@ class SIRGui:
 
     def start(self):
         """ This method is run once before the simulation starts. """
-        self.SIR = Grid(self.cols, self.rows, **self.kwargs)
-        self.SIR.infect(25, 25)
+        if self.replay is None:
+            self.SIR = self.engine(self.cols, self.rows, **self.kwargs)
+            self.SIR.infect(25, 25)
+        else:
+            self.SIR = Replay(self.replay)
         self.store_state()
-        data = pd.DataFrame(self.SIR.get_states())
         self.cvs.start()
-        self.cvs.update(data)
+        self.cvs.update(self.SIR.state)
 
     def update(self):
         """ Updates the screen. """
         # Update cell values
-        self.SIR.step()
-        data = pd.DataFrame(self.SIR.get_states())
-        self.cvs.update(data)
+        done = self.SIR.step()
+        self.cvs.update(self.SIR.state)
         # Keep calling for updates
 
         self.store_state()
 
-        if not self.find_infected():
+        if not self.find_infected() or (self.replay is not None and done):
             # end simulation if no infected people are found
             self.auto_exit()
 
@@ -71,8 +87,7 @@ class SIRGui:
     def manual_update(self, event):
         """ Updates the grid. """
         self.SIR.step()
-        data = pd.DataFrame(self.SIR.get_states())
-        self.cvs.update(data)
+        self.cvs.update(self.SIR.state)
 
     def exit(self, event):
         """ Exits the application. """
@@ -90,15 +105,9 @@ class SIRGui:
 
     def store_state(self):
         """ Records the number of people in all states"""
-        a = np.zeros(3)
-        for i in self.SIR.cell_list:
-            for j in i:
-                if j.compartment == 'S':
-                    a[0] += 1
-                elif j.compartment == 'I':
-                    a[1] += 1
-                else:
-                    a[2] += 1
+        counts = np.bincount(self.SIR.state.ravel(), minlength=len(COMPARTMENTS))
+        # Exposed and dead people are counted as recovered
+        a = np.array([counts[0], counts[1], counts[2:].sum()], dtype=float)
         self.state_counts.append(a)
 
     def plot_states(self):
@@ -121,6 +130,9 @@ class SIRGui:
 
 
 if __name__ == "__main__":
+    # SIRGui(51, 51, 'auto', replay='simulations/run.npz')
+    # SIRGui(1000, 1000, 'auto', renderer='raster', replay='simulations/run.npz')
+    # SIRGui(1000, 1000, 'auto', renderer='raster', neighbours='radius', radius=1)
     # SIRGui(51, 51, 'auto', neighbours='all')
     # SIRGui(51, 51, 'auto', neighbours='radius', radius=1)
     # SIRGui(51, 51, 'auto', neighbours='random', nr_of_neighbours=5)
@@ -0,0 +1,128 @@
+"""
+Neighbour index tables for the cellular SIR model.
+
+Cells are addressed by their flat index in the grid state array, which is
+col * height + row. Neighbourhoods wrap around the edges of the grid.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+
+def radius_offsets(radius):
+    """ Returns the column and row offsets of all cells within radius, skipping the center. """
+    span = np.arange(-radius, radius + 1)
+    # Same order as looping over columns first and rows second
+    dx, dy = np.meshgrid(span, span, indexing='ij')
+    center = (dx == 0) & (dy == 0)
+    return dx[~center], dy[~center]
+
+
+def radius_indices(width, height, radius, idx):
+    """ Returns a (len(idx), k) array with the flat indices of the neighbours of every cell in idx. """
+    x, y = np.divmod(idx, height)
+    dx, dy = radius_offsets(radius)
+    # Modulo makes the grid loop around so we don't have to worry about border cases.
+    return ((x[:, None] + dx) % width) * height + (y[:, None] + dy) % height
+
+
+@lru_cache(maxsize=8)
+def radius_table(width, height, radius):
+    """
+    Returns the (width * height, k) neighbour table of a grid shape.
+
+    Row i holds the flat indices of the neighbours of cell i. The table is
+    read-only and cached, so it is shared by all grids and replicates with
+    the same width, height and radius.
+    """
+    table = radius_indices(width, height, radius, np.arange(width * height)).astype(np.int32)
+    table.setflags(write=False)
+    return table
+
+
+def sample_random(rng, width, height, idx, k):
+    """
+    Samples k distinct neighbours for every cell in idx, uniformly from all other cells.
+
+    Uses Floyd's algorithm for all cells at once, so no draw is ever rejected.
+    """
+    others = width * height - 1
+    neigh = np.empty((len(idx), k), dtype=np.int64)
+    for j, top in enumerate(range(others - k, others)):
+        # Draw from [0, top], take top itself if the draw was already taken
+        draw = rng.integers(0, top + 1, size=len(idx))
+        taken = (neigh[:, :j] == draw[:, None]).any(axis=1)
+        neigh[:, j] = np.where(taken, top, draw)
+    # Skip the cell itself
+    neigh += neigh >= idx[:, None]
+    return neigh
+
+
+def sample_gauss(rng, width, height, idx, k, SD):
+    """
+    Samples k distinct neighbours for every cell in idx, using gaussian distributed offsets.
+
+    Draws batches of candidates for all cells at once and keeps the first k
+    distinct ones in draw order, so the result has the same distribution as
+    drawing one offset at a time and skipping duplicates and the cell itself.
+    """
+    x, y = np.divmod(idx, height)
+    neigh = np.empty((len(idx), k), dtype=np.int64)
+    todo = np.arange(len(idx))
+    drawn = np.empty((len(idx), 0), dtype=np.int64)
+    while len(todo):
+        # Offsets are truncated towards zero and wrapped around the grid
+        dx = np.trunc(rng.normal(0, SD, (len(todo), 2 * k))).astype(np.int64)
+        dy = np.trunc(rng.normal(0, SD, (len(todo), 2 * k))).astype(np.int64)
+        candidates = ((x[todo, None] + dx) % width) * height + (y[todo, None] + dy) % height
+        drawn = np.concatenate((drawn, candidates), axis=1)
+        # Mark the first occurrence of every candidate, a stable sort keeps draw order among equals
+        order = np.argsort(drawn, axis=1, kind='stable')
+        ordered = np.take_along_axis(drawn, order, axis=1)
+        first = np.ones(drawn.shape, dtype=bool)
+        np.put_along_axis(first, order[:, 1:], ordered[:, 1:] != ordered[:, :-1], axis=1)
+        valid = first & (drawn != idx[todo, None])
+        # Keep the first k valid candidates of every cell that has enough of them
+        accepted = valid & (np.cumsum(valid, axis=1) <= k)
+        complete = accepted.sum(axis=1) == k
+        neigh[todo[complete]] = drawn[complete][accepted[complete]].reshape(-1, k)
+        todo = todo[~complete]
+        drawn = drawn[~complete]
+    return neigh
+
+
+def sample_distinct(rng, counts, sizes):
+    """
+    Draws counts[i] distinct values from range(sizes[i]) for every i at once.
+
+    Returns two flat arrays, the owner i of every draw and the drawn value.
+    Counts larger than the size are capped to the size.
+    """
+    counts = np.minimum(counts, sizes)
+    owner = np.repeat(np.arange(len(counts)), counts)
+    picks = rng.integers(0, np.maximum(sizes[owner], 1))
+    # Owners that take everything get every value once, so they never have to redraw
+    full = counts[owner] == sizes[owner]
+    picks[full] = (np.arange(len(owner)) - (np.cumsum(counts) - counts)[owner])[full]
+    while True:
+        # Redraw values an owner already drew until every owner has distinct values
+        order = np.lexsort((picks, owner))
+        repeated = np.zeros(len(picks), dtype=bool)
+        repeated[order[1:]] = (owner[order[1:]] == owner[order[:-1]]) & (picks[order[1:]] == picks[order[:-1]])
+        if not repeated.any():
+            return owner, picks
+        picks[repeated] = rng.integers(0, sizes[owner[repeated]])
+
+
+def choose_targets(rng, neigh, available, counts):
+    """
+    Chooses counts[i] of the available neighbours in row i of neigh, without replacement.
+
+    Returns a boolean mask of the chosen entries of neigh. Rows with fewer
+    available neighbours than their count choose all of them.
+    """
+    # Random keys, unavailable neighbours are sorted last
+    keys = rng.random(neigh.shape)
+    keys[~available] = 2
+    rank = keys.argsort(axis=1).argsort(axis=1)
+    return available & (rank < counts[:, None])
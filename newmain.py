@@ -5,11 +5,12 @@ SIR as a Cellular Automaton
 This code is part of a project for the course Natural Computing.
 """
 import numpy as np
-import pandas as pd
 
 from tkinter import *
-from interface import CellViz
-from grid import Grid
+from interface import CellViz, RasterViz
+from grid import Grid, COMPARTMENTS
+from arraygrid import ArrayGrid
+from eventlog import Replay
 
 import matplotlib.pyplot as plt
 
@@ -18,8 +19,16 @@ class SIRGui:
     FRAME_RATE = 1000 // 5          # Miliseconds per frame
     state_counts = []
 
-    def __init__(self, rows, cols, mode='auto', start_loc=(25, 25), model="SIR", beta=0.76, inf_thr=2.2, exp_thr=5.2, modeltype="S-based", **kwargs):
-        """ Constructs a window in which visualisation will take place. """
+    def __init__(self, rows, cols, mode='auto', start_loc=(25, 25), model="SIR", beta=0.76, inf_thr=2.2, exp_thr=5.2, modeltype="S-based", replay=None, renderer='cells', engine=None, **kwargs):
+        """
+        Constructs a window in which visualisation will take place.
+
+        renderer is 'cells' to draw every cell as a rectangle, or 'raster' to
+        draw the grid as one image, which keeps up with much larger grids.
+        engine is the grid class of runs that are not replays, e.g. ArrayGrid
+        or FrontierGrid. Default is ArrayGrid for the raster renderer, as the
+        Cell objects of Grid are too slow for large grids, and Grid otherwise.
+        """
         # Store rows and cols
         self.rows = rows
         self.cols = cols
@@ -30,6 +39,11 @@ class SIRGui:
         self.exp_thr = exp_thr
         self.start_loc = start_loc
         self.modeltype = modeltype
+        # Event log of a recorded run to play back instead of simulating
+        self.replay = replay
+        if engine is None:
+            engine = ArrayGrid if renderer == 'raster' else Grid
+        self.engine = engine
 
         # Create window
         self.window = Tk()
@@ -40,7 +54,8 @@ class SIRGui:
         self.window.configure(background='#3d3d3d')
 
         # Add canvas
-        self.cvs = CellViz(self.window, cols, rows, 720, colors=['gray', 'red', 'green', 'yellow'], outline='gray')
+        viz = RasterViz if renderer == 'raster' else CellViz
+        self.cvs = viz(self.window, cols, rows, 720, colors=['gray', 'red', 'green', 'yellow'], outline='gray')
         self.cvs.grid(column=0, row=0)
 
         # Show window
@@ -51,24 +66,25 @@ class SIRGui:
 
     def start(self):
         """ This method is run once before the simulation starts. """
-        self.SIR = Grid(self.cols, self.rows, model=self.model, beta=self.beta, inf_thr=self.inf_thr, exp_thr=self.exp_thr, modeltype=self.modeltype, **self.kwargs)
-        self.SIR.infect(self.start_loc[0], self.start_loc[1])
+        if self.replay is None:
+            self.SIR = self.engine(self.cols, self.rows, model=self.model, beta=self.beta, inf_thr=self.inf_thr, exp_thr=self.exp_thr, modeltype=self.modeltype, **self.kwargs)
+            self.SIR.infect(self.start_loc[0], self.start_loc[1])
+        else:
+            self.SIR = Replay(self.replay)
         self.store_state()
-        data = pd.DataFrame(self.SIR.get_states())
         self.cvs.start()
-        self.cvs.update(data)
+        self.cvs.update(self.SIR.state)
 
     def update(self):
         """ Updates the screen. """
         # Update cell values
-        self.SIR.step()
-        data = pd.DataFrame(self.SIR.get_states())
-        self.cvs.update(data)
+        done = self.SIR.step()
+        self.cvs.update(self.SIR.state)
         # Keep calling for updates
 
         self.store_state()
 
-        if not self.find_infected():
+        if not self.find_infected() or (self.replay is not None and done):
             # end simulation if no infected people are found
             self.auto_exit()
 
@@ -77,8 +93,7 @@ class SIRGui:
     def manual_update(self, event):
         """ Updates the grid. """
         self.SIR.step()
-        data = pd.DataFrame(self.SIR.get_states())
-        self.cvs.update(data)
+        self.cvs.update(self.SIR.state)
 
     def exit(self, event):
         """ Exits the application. """
@@ -96,17 +111,9 @@ class SIRGui:
 
     def store_state(self):
         """ Records the number of people in all states"""
-        a = np.zeros(4)
-        for i in self.SIR.cell_list:
-            for j in i:
-                if j.compartment == 'S':
-                    a[0] += 1
-                elif j.compartment == 'I':
-                    a[1] += 1
-                elif j.compartment == 'R':
-                    a[2] += 1
-                else:
-                    a[3] += 1
+        counts = np.bincount(self.SIR.state.ravel(), minlength=len(COMPARTMENTS))
+        # Dead people are counted as exposed
+        a = np.array([counts[0], counts[1], counts[2], counts[3:].sum()], dtype=float)
         self.state_counts.append(a)
 
     def plot_states(self):
@@ -136,6 +143,9 @@ class SIRGui:
 
 
 if __name__ == "__main__":
+    # SIRGui(51, 51, 'auto', replay='simulations/run.npz')
+    # SIRGui(1000, 1000, 'auto', renderer='raster', replay='simulations/run.npz')
+    # SIRGui(1000, 1000, 'auto', renderer='raster', neighbours='radius', radius=1)
     # SIRGui(51, 51, 'auto', neighbours='all', model='SEIR')
     SIRGui(10, 10, start_loc=[4,4] , mode='auto', neighbours='radius', radius=1, model='SEIR', modeltype='I-based')
     # SIRGui(51, 51, 'auto', neighbours='random', nr_of_neighbours=5)
@@ -0,0 +1,234 @@
+"""
+Streaming statistics over replicates of the SIR models.
+
+Every replicate is added as soon as it finishes and then forgotten, so
+memory does not grow with the number of replicates. Summaries come out
+in the layout of DataFrame.groupby(...).describe(), the layout of the
+stats CSV files in simulations/.
+"""
+import numpy as np
+import pandas as pd
+
+# Evaluation metrics of a single run
+METRICS = ['Tot_I', 'Max_I', 'Duration']
+
+
+def metrics(history, population):
+    """ Returns the total and maximum % of the population infected and the duration of the pandemic. """
+    I = np.asarray(history['I'])
+    # The pandemic is over on the first timestep without infected people
+    over = np.flatnonzero(I < 0.5)
+    return {
+        'Tot_I': history['R'][-1] / population * 100,
+        'Max_I': I.max() / population * 100,
+        'Duration': over[0] if len(over) else len(I),
+    }
+
+
+class QuantileSketch:
+    """
+    Streaming estimate of the quantiles of a metric, a KLL-style sketch
+
+    Observations are kept in levels, an observation on level h stands for
+    2**h observations. When a level is full it is sorted and every other
+    observation moves up a level, so the error in the rank of a quantile
+    stays small whatever the shape of the distribution, also for the two
+    modes of fade-outs and full outbreaks. The estimate is always close to
+    an observation, never in the gap between modes. Quantiles are exact as
+    long as no level was compacted.
+
+    Attributes:
+        capacity (int):     number of observations a level holds before it is compacted
+    """
+
+    def __init__(self, capacity=200):
+        self.capacity = capacity
+        self.levels = [[]]
+        # Whether the next compaction of a level keeps the odd or the even observations
+        self._offsets = [0]
+
+    def add(self, x):
+        """ Adds an observation. """
+        self.levels[0].append(x)
+        if len(self.levels[0]) > self.capacity:
+            self._compact(0)
+
+    def _compact(self, h):
+        """ Moves every other observation of level h up a level. """
+        if h + 1 == len(self.levels):
+            self.levels.append([])
+            self._offsets.append(0)
+        level = sorted(self.levels[h])
+        # An odd observation stays behind, so the total weight is unchanged
+        self.levels[h] = [level.pop()] if len(level) % 2 else []
+        self.levels[h + 1].extend(level[self._offsets[h]::2])
+        # Alternate the offset so that compactions do not bias the ranks
+        self._offsets[h] ^= 1
+        if len(self.levels[h + 1]) > self.capacity:
+            self._compact(h + 1)
+
+    def quantile(self, p):
+        """ Returns the estimate of quantile p, between 0 and 1. """
+        if len(self.levels) == 1:
+            return np.percentile(self.levels[0], 100 * p) if self.levels[0] else np.nan
+        values = np.concatenate([np.asarray(level, dtype=float) for level in self.levels])
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        values, weights = values[order], weights[order]
+        # Weighted rank of the middle of every observation
+        ranks = np.cumsum(weights) - weights / 2
+        return float(np.interp(p * weights.sum(), ranks, values))
+
+
+class RunningStats:
+    """
+    Streaming count, mean, standard deviation, minimum, maximum and quartiles of a metric
+
+    The mean and variance use Welford's algorithm, the quartiles a
+    QuantileSketch, which is exact for the first capacity observations.
+
+    Attributes:
+        quantiles (tuple):  quantiles to keep track of
+        capacity (int):     number of observations per level of the quantile sketch
+    """
+
+    def __init__(self, quantiles=(0.25, 0.5, 0.75), capacity=200):
+        self.quantiles = quantiles
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.sketch = QuantileSketch(capacity)
+
+    def add(self, x):
+        """ Adds an observation. """
+        x = float(x)
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+        self.sketch.add(x)
+
+    @property
+    def var(self):
+        """ Sample variance, like pandas. """
+        return self._m2 / (self.count - 1) if self.count > 1 else np.nan
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+    def quantile(self, i):
+        """ Returns the estimate of quantile number i. """
+        return self.sketch.quantile(self.quantiles[i])
+
+    def ci(self, z=1.96):
+        """ Returns the half width of the confidence interval of the mean. """
+        return z * self.std / np.sqrt(self.count) if self.count > 1 else np.inf
+
+    def describe(self):
+        """ Returns a dict with the columns of describe. """
+        empty = not self.count
+        stats = {'count': float(self.count), 'mean': np.nan if empty else self.mean, 'std': self.std,
+                 'min': np.nan if empty else self.min}
+        for i, p in enumerate(self.quantiles):
+            stats[f'{p * 100:g}%'] = self.quantile(i)
+        stats['max'] = np.nan if empty else self.max
+        return stats
+
+
+class TimestepStats:
+    """
+    Streaming mean and confidence band of every timestep of the histories of replicates
+
+    Shorter histories are padded with their final counts, like padding
+    every replicate to the longest run, without storing the replicates.
+
+    Attributes:
+        model (str):        compartments to keep track of, e.g. SIR
+    """
+
+    def __init__(self, model="SIR"):
+        self.model = model
+        self.count = 0
+        # Sums and sums of squares of every compartment at every timestep
+        self._sum = np.zeros((0, len(model)))
+        self._sumsq = np.zeros((0, len(model)))
+        # Sums of the final counts, which pad the timesteps after a replicate ended
+        self._final = np.zeros(len(model))
+        self._finalsq = np.zeros(len(model))
+
+    def add(self, history):
+        """ Adds the history of a replicate, a dict with the counts of every compartment. """
+        counts = np.column_stack([np.asarray(history[k], dtype=float) for k in self.model])
+        length, longest = len(counts), len(self._sum)
+        if length > longest:
+            # Earlier replicates are padded with their final counts
+            self._sum = np.concatenate((self._sum, np.tile(self._final, (length - longest, 1))))
+            self._sumsq = np.concatenate((self._sumsq, np.tile(self._finalsq, (length - longest, 1))))
+        self._sum[:length] += counts
+        self._sumsq[:length] += counts ** 2
+        self._sum[length:] += counts[-1]
+        self._sumsq[length:] += counts[-1] ** 2
+        self._final += counts[-1]
+        self._finalsq += counts[-1] ** 2
+        self.count += 1
+
+    def to_frame(self, z=1.96):
+        """ Returns a DataFrame with the mean and the bounds of the confidence interval of every compartment per timestep. """
+        mean = self._sum / self.count
+        var = np.maximum(self._sumsq / self.count - mean ** 2, 0) * self.count / max(self.count - 1, 1)
+        half = z * np.sqrt(var / self.count)
+        frame = pd.DataFrame({'Timestep': np.arange(len(mean))})
+        for i, k in enumerate(self.model):
+            frame[k] = mean[:, i]
+            frame[f'{k}_lower'] = mean[:, i] - half[:, i]
+            frame[f'{k}_upper'] = mean[:, i] + half[:, i]
+        return frame
+
+
+class Summary:
+    """
+    Streaming summary of the metrics of many configurations, grouped by index
+
+    Attributes:
+        index (list):       names of the variables that identify a configuration, e.g. Model and Beta
+        metrics (list):     metrics to summarize
+    """
+
+    def __init__(self, index, metrics=METRICS, **kwargs):
+        self.index = list(index)
+        self.metrics = list(metrics)
+        self.kwargs = kwargs
+        self.groups = {}
+
+    def group(self, key):
+        """ Returns the statistics of the metrics of a configuration. """
+        key = key if isinstance(key, tuple) else (key,)
+        if key not in self.groups:
+            self.groups[key] = {m: RunningStats(**self.kwargs) for m in self.metrics}
+        return self.groups[key]
+
+    def add(self, key, values):
+        """ Adds the metrics of a replicate of a configuration. """
+        for m, stats in self.group(key).items():
+            stats.add(values[m])
+
+    def add_history(self, key, history, population):
+        """ Adds the history of a replicate of a configuration. """
+        self.add(key, metrics(history, population))
+
+    def to_frame(self):
+        """ Returns a DataFrame like DataFrame.groupby(index).describe() of all replicates. """
+        keys = sorted(self.groups)
+        rows = [[v for stats in self.groups[key].values() for v in stats.describe().values()] for key in keys]
+        columns = pd.MultiIndex.from_product([self.metrics, list(RunningStats(**self.kwargs).describe())])
+        index = pd.MultiIndex.from_tuples(keys, names=self.index)
+        return pd.DataFrame(rows, index=index, columns=columns)
+
+    def to_csv(self, path):
+        """ Writes the summary in the layout of the stats CSV files. """
+        self.to_frame().to_csv(path)
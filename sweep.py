@@ -0,0 +1,293 @@
+"""
+Parameter sweeps over the cellular and mathematical SIR models.
+
+Every configuration of a parameter grid is expanded into one job per
+replicate. Jobs run on a process pool and their metrics stream back as
+rows of one tidy table while the sweep is still running. Adaptive sweeps
+add replicates to a configuration until its metrics are precise enough.
+"""
+import collections.abc
+import hashlib
+import itertools
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+
+from tqdm import tqdm
+
+import cache
+from stats import metrics, METRICS, RunningStats, Summary
+from grid import Grid
+from arraygrid import ArrayGrid
+from frontier import FrontierGrid
+from gillespie import GillespieGrid
+from hybrid import HybridGrid
+
+# Cellular engines that can be selected with the 'engine' parameter
+ENGINES = {'grid': Grid, 'array': ArrayGrid, 'frontier': FrontierGrid, 'gillespie': GillespieGrid, 'hybrid': HybridGrid}
+
+# Settings of the mathematical model
+MAX_DAYS = 750
+
+
+def _sweep_values(key, value):
+    """ Returns the list of values a parameter is swept over. """
+    if isinstance(value, np.ndarray):
+        # Plain Python numbers, like the values of a list
+        return value.tolist() if value.ndim else [value.item()]
+    if key == 'size' and isinstance(value, tuple):
+        # A single (width, height), sweep sizes with a list
+        return [value]
+    if isinstance(value, collections.abc.Sequence) and not isinstance(value, (str, bytes)):
+        return list(value)
+    return [value]
+
+
+def expand(param_grid):
+    """ Returns a list of configurations, one for every combination of the sequences in param_grid. """
+    if isinstance(param_grid, list):
+        # A list of parameter grids is swept one after the other
+        return [config for grid in param_grid for config in expand(grid)]
+    keys = list(param_grid)
+    # Sequences are swept, any other value is the same for all configurations
+    values = [_sweep_values(k, v) for k, v in param_grid.items()]
+    return [dict(zip(keys, combination)) for combination in itertools.product(*values)]
+
+
+def job_seed(seed, config, replicate):
+    """
+    Returns the SeedSequence of one replicate of a configuration.
+
+    Children of the root seed are keyed by the content of the configuration
+    and the replicate number, so a job gets the same stream no matter how
+    the sweep is ordered, extended or distributed over processes.
+    """
+    # NumPy scalars hash like the Python numbers they equal
+    normalized = sorted((k, cache._normalize(v)) for k, v in config.items())
+    key = hashlib.sha256(repr(normalized).encode()).digest()
+    return np.random.SeedSequence(seed, spawn_key=(int.from_bytes(key[:8], 'little'), replicate))
+
+
+def simulate(config, seed=None, cache_dir=None):
+    """ Runs a single simulation of a configuration and returns its history, through the cache in cache_dir if given. """
+    config = dict(config)
+    engine = config.pop('engine', 'array')
+    size = config.pop('size')
+    width, height = (size, size) if isinstance(size, int) else size
+    results = None if cache_dir is None else cache.get_cache(cache_dir)
+    if engine == 'mathematical':
+        R_0 = config['beta'] / config['gamma']
+        # The mathematical model is deterministic, it has no use for the seed
+        args = (width * height, R_0, config['gamma'], config.get('infected', 1), MAX_DAYS, config.get('model', 'SIR'))
+        # Integrator of the mathematical model, see SIR.METHODS
+        kwargs = {'method': config['method']} if 'method' in config else {}
+        return cache.Mat_SIR(*args, **kwargs) if results is None else cache.SIR(*args, cache=results, **kwargs)
+    if results is None:
+        return ENGINES[engine].simulate(width, height, seed=seed, **config)
+    return cache.simulate(ENGINES[engine], width, height, seed=seed, cache=results, **config)
+
+
+def _run_job(job):
+    """ Runs one replicate of a configuration, used by the worker processes. """
+    config, replicate, seed, cache_dir = job
+    size = config['size']
+    population = size * size if isinstance(size, int) else size[0] * size[1]
+    history = simulate(config, job_seed(seed, config, replicate), cache_dir)
+    return {**config, 'Sim': replicate, **metrics(history, population)}
+
+
+def _run_indexed_job(job):
+    """ Runs one replicate of a job tagged with the index of its configuration. """
+    i, job = job
+    return i, _run_job(job)
+
+
+def _jobs(param_grid, replicates, seed, cache_dir=None):
+    """ Returns a list of (configuration, replicate, root seed, cache directory) jobs. """
+    jobs = []
+    for config in expand(param_grid):
+        # The mathematical model is deterministic, so it only needs one run
+        n = 1 if config.get('engine', 'array') == 'mathematical' else replicates
+        jobs.extend((config, i, seed, cache_dir) for i in range(1, n + 1))
+    return jobs
+
+
+def iter_sweep(param_grid, replicates=25, processes=None, chunksize=1, seed=None, cache_dir=None):
+    """
+    Runs a parameter sweep and yields one row of metrics per finished replicate.
+
+    Args:
+        param_grid (dict):  Simulation keyword arguments, lists, tuples, ranges
+                            and arrays are swept. Use 'size' for the grid
+                            size, an int or a (width, height) tuple, 'engine' to select grid,
+                            array, frontier, gillespie, hybrid or mathematical,
+                            and 'method' for the integrator of the
+                            mathematical model. A list of dicts sweeps every
+                            dict.
+
+    Kwargs:
+        replicates (int):   Number of simulations per configuration.
+                            Default is 25.
+        processes (int):    Number of worker processes, 1 runs in this process.
+                            Default is the number of CPUs.
+        chunksize (int):    Number of jobs handed to a worker at once. Small
+                            chunks keep workers busy when durations vary.
+                            Default is 1.
+        seed (int):         Root seed of the sweep, results are identical for
+                            the same seed whatever the number of processes.
+                            Default is a fresh seed.
+        cache_dir (str):    Directory of the result cache. With a fixed seed,
+                            re-running or extending a sweep only computes
+                            the missing jobs. Default is no caching.
+    """
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    jobs = _jobs(param_grid, replicates, seed, cache_dir)
+    processes = processes or os.cpu_count()
+    if processes == 1:
+        yield from map(_run_job, jobs)
+        return
+    with multiprocessing.Pool(processes) as pool:
+        # Rows come back in order of completion
+        yield from pool.imap_unordered(_run_job, jobs, chunksize=chunksize)
+
+
+def _precision(precision, target_metrics):
+    """ Returns the target half width of the confidence interval of every metric. """
+    if isinstance(precision, dict):
+        return {m: precision[m] for m in target_metrics}
+    return {m: precision for m in target_metrics}
+
+
+def iter_adaptive(param_grid, precision, min_replicates=10, max_replicates=200, batch=10, target_metrics=METRICS, z=1.96,
+                  processes=None, chunksize=1, seed=None, cache_dir=None):
+    """
+    Runs a parameter sweep with as many replicates per configuration as needed and yields one row per finished replicate.
+
+    Every configuration gets min_replicates replicates. After that, replicates
+    are added in rounds until the confidence interval of the mean of every
+    metric is at most precision wide on either side, or until max_replicates
+    replicates have run. Configurations with a high variance, like the ones
+    that either fade out early or infect everybody, get more replicates.
+
+    Args:
+        param_grid (dict):  Simulation keyword arguments, see iter_sweep.
+        precision (float):  Target half width of the confidence intervals, or
+                            a dict with a target for every metric, as Tot_I
+                            and Max_I are percentages and Duration is in days.
+
+    Kwargs:
+        min_replicates (int): Number of simulations every configuration gets.
+                            Default is 10.
+        max_replicates (int): Maximum number of simulations per configuration.
+                            Default is 200.
+        batch (int):        Maximum number of replicates added to a configuration
+                            per round. Default is 10.
+        target_metrics (list): Metrics that have to reach the precision.
+                            Default is Tot_I, Max_I and Duration.
+        z (float):          z-score of the confidence level. Default is 1.96, 95%.
+
+    See iter_sweep for the other arguments. Replicates are added only once all
+    replicates of the previous round have finished, so the rows are the same
+    for the same seed whatever the number of processes.
+    """
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    targets = _precision(precision, target_metrics)
+    configs = expand(param_grid)
+    stats = [{m: RunningStats() for m in target_metrics} for _ in configs]
+    # The mathematical model is deterministic, so it only needs one run
+    budgets = [1 if config.get('engine', 'array') == 'mathematical' else max_replicates for config in configs]
+    submitted = [0] * len(configs)
+    wanted = [min(min_replicates, budget) for budget in budgets]
+    processes = processes or os.cpu_count()
+    pool = multiprocessing.Pool(processes) if processes > 1 else None
+    try:
+        while True:
+            jobs = [(i, (configs[i], r, seed, cache_dir)) for i in range(len(configs))
+                    for r in range(submitted[i] + 1, wanted[i] + 1)]
+            if not jobs:
+                return
+            submitted = list(wanted)
+            if pool is None:
+                rows = map(_run_indexed_job, jobs)
+            else:
+                rows = pool.imap_unordered(_run_indexed_job, jobs, chunksize=chunksize)
+            for i, row in rows:
+                for m, s in stats[i].items():
+                    s.add(row[m])
+                yield row
+            for i, s in enumerate(stats):
+                if all(s[m].ci(z) <= targets[m] for m in target_metrics):
+                    continue
+                # Number of replicates that reaches the precision, estimated from the variance so far
+                needed = max((int(np.ceil((z * s[m].std / targets[m]) ** 2)) for m in target_metrics if s[m].count > 1), default=0)
+                wanted[i] = min(budgets[i], submitted[i] + batch, max(needed, submitted[i] + 1))
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+def run_adaptive(param_grid, precision, min_replicates=10, max_replicates=200, batch=10, target_metrics=METRICS, z=1.96,
+                 processes=None, chunksize=1, seed=None, cache_dir=None, csv=None, verbose=True):
+    """
+    Runs an adaptive parameter sweep and returns a tidy DataFrame with one row per replicate.
+
+    See iter_adaptive for the arguments. If csv is given, every row is appended
+    to that file as soon as it arrives.
+    """
+    rows = []
+    results = iter_adaptive(param_grid, precision, min_replicates, max_replicates, batch, target_metrics, z,
+                            processes, chunksize, seed, cache_dir)
+    if verbose:
+        # The total number of replicates is not known in advance
+        results = tqdm(results)
+    for row in results:
+        rows.append(row)
+        if csv is not None:
+            pd.DataFrame([row]).to_csv(csv, mode='a', header=len(rows) == 1, index=False)
+    return pd.DataFrame(rows)
+
+
+def run_sweep(param_grid, replicates=25, processes=None, chunksize=1, seed=None, cache_dir=None, csv=None, verbose=True):
+    """
+    Runs a parameter sweep and returns a tidy DataFrame with one row per replicate.
+
+    See iter_sweep for the arguments. If csv is given, every row is appended
+    to that file as soon as it arrives.
+    """
+    rows = []
+    results = iter_sweep(param_grid, replicates, processes, chunksize, seed, cache_dir)
+    if verbose:
+        results = tqdm(results, total=len(_jobs(param_grid, replicates, seed)))
+    for row in results:
+        rows.append(row)
+        if csv is not None:
+            pd.DataFrame([row]).to_csv(csv, mode='a', header=len(rows) == 1, index=False)
+    return pd.DataFrame(rows)
+
+
+def summarize_sweep(param_grid, index, replicates=25, processes=None, chunksize=1, seed=None, cache_dir=None, csv=None, verbose=True):
+    """
+    Runs a parameter sweep and returns the describe table of the metrics per configuration.
+
+    Rows are added to a stats.Summary as they arrive and are not kept, index
+    names the parameters that identify a configuration, e.g. ['engine', 'beta'].
+    See iter_sweep for the other arguments. If csv is given, the table is
+    written to that file in the layout of the stats CSV files.
+    """
+    summary = Summary(index)
+    results = iter_sweep(param_grid, replicates, processes, chunksize, seed, cache_dir)
+    if verbose:
+        results = tqdm(results, total=len(_jobs(param_grid, replicates, seed)))
+    for row in results:
+        summary.add(tuple(row[k] for k in index), row)
+    if csv is not None:
+        summary.to_csv(csv)
+    return summary.to_frame()
+
+
+if __name__ == "__main__":
+    print(run_sweep({'size': 22, 'beta': [0.4, 0.7, 1.0], 'gamma': 0.2, 'neighbours': ['all', 'radius'], 'engine': 'array'}, replicates=10))